@@ -7,6 +7,38 @@ DROP TABLE IF EXISTS ppi_points CASCADE;
 -- Enable PostGIS
 CREATE EXTENSION IF NOT EXISTS postgis;
 
+-- FAO-56 Penman-Monteith reference evapotranspiration (mm/day), same formula as
+-- scripts/compute_et0.py (G = 0, Rn = solar radiation, default altitude 143 m)
+CREATE OR REPLACE FUNCTION fao56_et0(
+    tmin DOUBLE PRECISION,
+    tmax DOUBLE PRECISION,
+    radiation DOUBLE PRECISION,
+    rh DOUBLE PRECISION,
+    wind DOUBLE PRECISION,
+    altitude DOUBLE PRECISION DEFAULT 143
+) RETURNS DOUBLE PRECISION
+LANGUAGE sql IMMUTABLE AS $$
+    SELECT CASE
+        WHEN tmin IS NULL OR tmax IS NULL OR radiation IS NULL OR rh IS NULL OR wind IS NULL
+             OR radiation < 0 THEN NULL
+        ELSE ROUND(GREATEST(
+            (0.408 * v.delta * radiation
+             + v.gamma * (900 / (v.tmean + 273)) * wind * (v.es - v.es * rh / 100))
+            / (v.delta + v.gamma * (1 + 0.34 * wind)),
+            0)::numeric, 2)::double precision
+    END
+    FROM (
+        SELECT t.tmean,
+               t.es,
+               4098 * t.es / ((t.tmean + 237.3) ^ 2) AS delta,
+               0.000665 * 101.3 * ((293 - 0.0065 * altitude) / 293) ^ 5.26 AS gamma
+        FROM (
+            SELECT (tmin + tmax) / 2 AS tmean,
+                   0.6108 * exp(17.27 * ((tmin + tmax) / 2) / ((tmin + tmax) / 2 + 237.3)) AS es
+        ) t
+    ) v
+$$;
+
 -- PPI Points table (points d'intérêt)
 CREATE TABLE ppi_points (
     geohash TEXT PRIMARY KEY,
@@ -37,7 +69,7 @@ CREATE TABLE climate_daily (
     rain DOUBLE PRECISION,
     rh DOUBLE PRECISION,
     wind DOUBLE PRECISION,
-    et0 DOUBLE PRECISION,
+    et0 DOUBLE PRECISION GENERATED ALWAYS AS (fao56_et0(tmin, tmax, radiation, rh, wind)) STORED,
     created_at TIMESTAMP DEFAULT NOW(),
     PRIMARY KEY (geohash, date)
 );
@@ -64,6 +96,16 @@ CREATE INDEX idx_climate_daily_date ON climate_daily(date);
 CREATE INDEX idx_climate_7days_end_date ON climate_7days(end_date);
 CREATE INDEX idx_grid_100m_geom ON grid_100m USING GIST(geom);
 
+-- Indexes used by aggregate_7days (date range filter + GROUP BY geohash)
+CREATE INDEX IF NOT EXISTS climate_daily_date_brin ON climate_daily USING BRIN(date);
+CREATE INDEX IF NOT EXISTS climate_daily_gh_date_covering ON climate_daily (geohash, date)
+    INCLUDE (tmin, tmax, radiation, rain, rh, wind, et0);
+
+-- Covering indexes for make_map (one date, et0 IS NOT NULL, join on geohash): index-only scans
+CREATE INDEX IF NOT EXISTS ix_cd_date_et0 ON climate_daily (date)
+    INCLUDE (geohash, tmin, tmax, rain, rh, wind, et0) WHERE et0 IS NOT NULL;
+CREATE INDEX IF NOT EXISTS ix_grid_geohash ON grid_100m (geohash) INCLUDE (lat, lon, geom);
+
 -- Create view for latest data
 CREATE OR REPLACE VIEW latest_climate AS
 SELECT DISTINCT ON (geohash) 
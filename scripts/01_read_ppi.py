@@ -1,8 +1,11 @@
 import os
-import psycopg2
+import numpy as np
+from psycopg2.extras import execute_values
 import geopandas as gpd
 import geohash2
-#DBCONFIG 
+import shapely
+from pyproj import Transformer
+from db import getconn, putconn, closeall
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 SHP_PATH = os.path.join(BASE_DIR, "data/ppi", "ppi_piait.shp")
@@ -17,40 +20,49 @@ gdf = gpd.read_file(SHP_PATH)
 # 2️⃣ Filter JENDOUBA (uppercase safe)
 gdf = gdf[gdf["PPI_GOV"].str.upper() == "JENDOUBA"]
 
-# 3️⃣ Reproject to UTM (meters) for accurate centroid
-gdf_proj = gdf.to_crs(epsg=32632)
+# 3️⃣ Polygons in UTM (meters) for accurate centroid (shapefile is already UTM 32N)
+geoms = gdf.geometry.to_numpy()
+if gdf.crs.to_epsg() != 32632:
+    to_utm = Transformer.from_crs(gdf.crs, 32632, always_xy=True)
+    geoms = shapely.transform(geoms, lambda xy: np.column_stack(to_utm.transform(xy[:, 0], xy[:, 1])))
 
-# 4️⃣ Compute centroid
-gdf_proj["geometry"] = gdf_proj.geometry.centroid
+# 4️⃣ Compute centroid (vectorized)
+xs, ys = shapely.get_coordinates(shapely.centroid(geoms)).T
 
-# 5️⃣ Convert back to WGS84 (lat/lon)
-gdf = gdf_proj.to_crs(epsg=4326)
+# 5️⃣ Convert only the centroids back to WGS84 (lat/lon)
+to_wgs = Transformer.from_crs(32632, 4326, always_xy=True)
+lons, lats = to_wgs.transform(xs, ys)
+gdf = gpd.GeoDataFrame(gdf.drop(columns="geometry"),
+                       geometry=gpd.points_from_xy(lons, lats), crs=4326)
 
 # 6️⃣ Export corrected GeoJSON (real map coordinates)
 gdf.to_file(OUTPUT_PATH, driver="GeoJSON")
 
 # 7️⃣ Insert into PostgreSQL
-conn = psycopg2.connect(**DB_CONFIG)
+conn = getconn()
 cur = conn.cursor()
 
-for _, row in gdf.iterrows():
-    lat = row.geometry.y
-    lon = row.geometry.x
-    geoh = geohash2.encode(lat, lon, precision=7)
-
-    cur.execute("""
-        INSERT INTO ppi_points (ppi_nom, gov_name, lat, lon, geohash)
-        VALUES (%s,%s,%s,%s,%s)
-        ON CONFLICT (geohash) DO NOTHING
-    """, (
-        row["PPI_NOM"],
-        row["PPI_GOV"],
-        lat,
-        lon,
-        geoh
-    ))
+lats = gdf.geometry.y.to_numpy()
+lons = gdf.geometry.x.to_numpy()
+geohashes = [geohash2.encode(lat, lon, precision=7) for lat, lon in zip(lats, lons)]
+
+rows = list(zip(
+    gdf["PPI_NOM"],
+    gdf["PPI_GOV"],
+    lats.tolist(),
+    lons.tolist(),
+    geohashes
+))
+
+# Single batched INSERT instead of one round-trip per row
+execute_values(cur, """
+    INSERT INTO ppi_points (ppi_nom, gov_name, lat, lon, geohash)
+    VALUES %s
+    ON CONFLICT (geohash) DO NOTHING
+""", rows, page_size=1000)
 
 conn.commit()
-conn.close()
+putconn(conn)
+closeall()
 
 print("JENDOUBA PPI exported and inserted successfully.")
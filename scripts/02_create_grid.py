@@ -1,13 +1,9 @@
-import psycopg2
-from shapely.geometry import box, mapping
-import geohash2
-import json
-
-# -----------------------------
-# Database configuration
-# -----------------------------
-DB_CONFIG = {
-}
+import argparse
+import csv
+import io
+import numpy as np
+import orjson
+from db import getconn, putconn, closeall
 
 # -----------------------------
 # Grid settings
@@ -15,6 +11,47 @@ DB_CONFIG = {
 GRID_SIZE = 0.001  # ~100m in degrees
 GEOJSON_FILE = "output/grid_100m.geojson"
 
+# -----------------------------
+# Vectorized geohash encoding
+# -----------------------------
+_BASE32 = np.frombuffer(b"0123456789bcdefghjkmnpqrstuvwxyz", dtype='S1')
+
+
+def _spread_bits(v):
+    """Spread the low 32 bits of v onto the even bit positions (Morton encoding)."""
+    v = v & np.uint64(0x00000000FFFFFFFF)
+    v = (v | (v << np.uint64(16))) & np.uint64(0x0000FFFF0000FFFF)
+    v = (v | (v << np.uint64(8))) & np.uint64(0x00FF00FF00FF00FF)
+    v = (v | (v << np.uint64(4))) & np.uint64(0x0F0F0F0F0F0F0F0F)
+    v = (v | (v << np.uint64(2))) & np.uint64(0x3333333333333333)
+    v = (v | (v << np.uint64(1))) & np.uint64(0x5555555555555555)
+    return v
+
+
+def encode_geohashes(lats, lons, precision=7):
+    """Geohash-encode arrays of lat/lon at once (same output as geohash2.encode)."""
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+
+    # Geohash interleaves lon/lat bits starting with lon
+    n_bits = 5 * precision
+    lon_bits = (n_bits + 1) // 2
+    lat_bits = n_bits // 2
+    lat_int = np.clip(np.floor((lats + 90.0) / 180.0 * 2.0 ** lat_bits),
+                      0, 2 ** lat_bits - 1).astype(np.uint64)
+    lon_int = np.clip(np.floor((lons + 180.0) / 360.0 * 2.0 ** lon_bits),
+                      0, 2 ** lon_bits - 1).astype(np.uint64)
+
+    lon_shift = np.uint64(1 - n_bits % 2)
+    code = (_spread_bits(lon_int) << lon_shift) | (_spread_bits(lat_int) << (np.uint64(1) - lon_shift))
+
+    # Base32-encode 5 bits at a time via a lookup table
+    chars = np.empty((lats.size, precision), dtype='S1')
+    for k in range(precision):
+        shift = np.uint64(5 * (precision - 1 - k))
+        chars[:, k] = _BASE32[((code >> shift) & np.uint64(31)).astype(np.intp)]
+    return chars.view(f'S{precision}').ravel().astype(str).tolist()
+
 # -----------------------------
 # PPI points for Jendouba
 # -----------------------------
@@ -23,10 +60,101 @@ ppi_points = [
     {"name": "El Brahmi", "coordinates": [36.604882, 8.885523]},    # lat, lon
 ]
 
+# -----------------------------
+# Axis-aligned grid cell as a GeoJSON feature (no shapely/GEOS round-trip)
+# -----------------------------
+def rect_feature(lon, lat, gs, props):
+    """Build a GeoJSON Feature for the rectangle [lon, lon+gs] x [lat, lat+gs]."""
+    lon2 = lon + gs
+    lat2 = lat + gs
+    return {
+        "type": "Feature",
+        "geometry": {
+            "type": "Polygon",
+            "coordinates": [[[lon, lat], [lon2, lat], [lon2, lat2], [lon, lat2], [lon, lat]]]
+        },
+        "properties": props
+    }
+
+# -----------------------------
+# Physical ordering for spatial locality
+# -----------------------------
+def cluster_grid(cur):
+    """
+    Rewrite grid_100m in spatial order so neighbouring cells share pages.
+    PostGIS >= 3.0 orders geometries along a Hilbert curve, so cluster on the GiST
+    index; older versions fall back to the geohash primary key (Z-order).
+    """
+    cur.execute("SELECT postgis_lib_version()")
+    major = int(cur.fetchone()[0].split(".")[0])
+    index = "idx_grid_100m_geom" if major >= 3 else "grid_100m_pkey"
+    cur.execute(f"CLUSTER grid_100m USING {index}")
+    cur.execute("ANALYZE grid_100m")
+    return index
+
+# -----------------------------
+# Server-side grid construction (PostGIS)
+# -----------------------------
+def create_grid_server_side(cur, min_lat, max_lat, min_lon, max_lon, geojson_path):
+    """
+    Generate the grid entirely in PostGIS with generate_series + ST_MakeEnvelope,
+    then dump the stored cells as GeoJSON in a single COPY ... TO STDOUT.
+    """
+    # Same cell counts as np.arange(min, max, GRID_SIZE) on the client path
+    n_lat = len(np.arange(min_lat, max_lat, GRID_SIZE))
+    n_lon = len(np.arange(min_lon, max_lon, GRID_SIZE))
+
+    cur.execute("""
+        INSERT INTO grid_100m (geohash, lat, lon, geom)
+        SELECT ST_GeoHash(ST_SetSRID(ST_MakePoint(c.lon + c.gs / 2, c.lat + c.gs / 2), 4326), 7),
+               c.lat + c.gs / 2,
+               c.lon + c.gs / 2,
+               ST_MakeEnvelope(c.lon, c.lat, c.lon + c.gs, c.lat + c.gs, 4326)
+        FROM (
+            SELECT %(min_lat)s::float + i * %(gs)s::float AS lat,
+                   %(min_lon)s::float + j * %(gs)s::float AS lon,
+                   %(gs)s::float AS gs
+            FROM generate_series(0, %(n_lat)s - 1) AS i,
+                 generate_series(0, %(n_lon)s - 1) AS j
+        ) c
+        ON CONFLICT (geohash) DO NOTHING
+    """, {"min_lat": min_lat, "min_lon": min_lon, "gs": GRID_SIZE,
+          "n_lat": n_lat, "n_lon": n_lon})
+
+    # Export the cells of this bounding box straight from the database
+    query = cur.mogrify("""
+        SELECT json_build_object(
+            'type', 'FeatureCollection',
+            'features', COALESCE(json_agg(json_build_object(
+                'type', 'Feature',
+                'geometry', ST_AsGeoJSON(geom)::json,
+                'properties', json_build_object(
+                    'geohash', geohash,
+                    'center_lat', lat,
+                    'center_lon', lon
+                )
+            ) ORDER BY geohash), '[]'::json)
+        )
+        FROM grid_100m
+        WHERE lat BETWEEN %s AND %s AND lon BETWEEN %s AND %s
+    """, (min_lat, min_lat + n_lat * GRID_SIZE, min_lon, min_lon + n_lon * GRID_SIZE))
+
+    with open(geojson_path, "w", encoding="utf-8") as f:
+        cur.copy_expert(f"COPY ({query.decode()}) TO STDOUT", f)
+
+    return n_lat * n_lon
+
 # -----------------------------
 # Main
 # -----------------------------
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Create the 100m grid over the PPI bounding box')
+    parser.add_argument('--server-side', action='store_true',
+                        help='Generate the grid inside PostGIS instead of Python')
+    parser.add_argument('--pretty', action='store_true',
+                        help='Indent the GeoJSON output (larger, slower; for debugging)')
+    args = parser.parse_args()
+
     # Extract lat/lon
     lats = [p["coordinates"][0] for p in ppi_points]
     lons = [p["coordinates"][1] for p in ppi_points]
@@ -38,51 +166,83 @@ if __name__ == "__main__":
 
     # Connect to database
     try:
-        conn = psycopg2.connect(**DB_CONFIG)
+        conn = getconn()
         cur = conn.cursor()
     except Exception as e:
         print("Database connection error:", e)
         exit()
 
+    if args.server_side:
+        n_cells = create_grid_server_side(cur, min_lat, max_lat, min_lon, max_lon, GEOJSON_FILE)
+        cluster_grid(cur)
+        conn.commit()
+        putconn(conn)
+        closeall()
+        print(f"Grid created server-side: {n_cells} cells")
+        print(f"GeoJSON output saved to: {GEOJSON_FILE}")
+        exit()
+
+    # Build every cell's lower-left corner at once instead of nested while loops
+    lat_arr = np.arange(min_lat, max_lat, GRID_SIZE)
+    lon_arr = np.arange(min_lon, max_lon, GRID_SIZE)
+    LA, LO = np.meshgrid(lat_arr, lon_arr, indexing='ij')
+    cell_lats = LA.ravel()
+    cell_lons = LO.ravel()
+
+    # Grid cell centers and geohashes for the whole grid in one pass
+    center_lats = cell_lats + GRID_SIZE / 2
+    center_lons = cell_lons + GRID_SIZE / 2
+    geohashes = encode_geohashes(center_lats, center_lons, precision=7)
+
+    rows = []
     features = []
 
-    lat = min_lat
-    while lat < max_lat:
-        lon = min_lon
-        while lon < max_lon:
-            # Grid cell center
-            center_lat = lat + GRID_SIZE / 2
-            center_lon = lon + GRID_SIZE / 2
-            geoh = geohash2.encode(center_lat, center_lon, precision=7)
-
-            # Grid cell polygon
-            poly = box(lon, lat, lon + GRID_SIZE, lat + GRID_SIZE)
-
-            # Insert into PostGIS table
-            cur.execute("""
-                INSERT INTO grid_100m (geohash, lat, lon, geom)
-                VALUES (%s, %s, %s, ST_GeomFromText(%s, 4326))
-                ON CONFLICT (geohash) DO NOTHING
-            """, (geoh, center_lat, center_lon, poly.wkt))
-
-            # Prepare GeoJSON feature
-            feature = {
-                "type": "Feature",
-                "geometry": mapping(poly),
-                "properties": {
-                    "geohash": geoh,
-                    "center_lat": center_lat,
-                    "center_lon": center_lon
-                }
-            }
-            features.append(feature)
-
-            lon += GRID_SIZE
-        lat += GRID_SIZE
+    # Bind hot-loop callables/constants to locals (avoids global/attribute lookups per cell)
+    _rect_feature = rect_feature
+    _append_row = rows.append
+    _append_feature = features.append
+    gs = GRID_SIZE
+
+    for lat, lon, center_lat, center_lon, geoh in zip(cell_lats.tolist(), cell_lons.tolist(),
+                                                      center_lats.tolist(), center_lons.tolist(),
+                                                      geohashes):
+        # Grid cell polygon (axis-aligned, so WKT can be written directly)
+        lat2 = lat + gs
+        lon2 = lon + gs
+        ewkt = f"SRID=4326;POLYGON(({lon} {lat},{lon2} {lat},{lon2} {lat2},{lon} {lat2},{lon} {lat}))"
+        _append_row((geoh, center_lat, center_lon, ewkt))
+
+        # Prepare GeoJSON feature
+        _append_feature(_rect_feature(lon, lat, gs, {
+            "geohash": geoh,
+            "center_lat": center_lat,
+            "center_lon": center_lon
+        }))
+
+    # Bulk load through COPY into a staging table, then upsert (COPY has no ON CONFLICT)
+    buf = io.StringIO()
+    csv.writer(buf).writerows(rows)
+    buf.seek(0)
+
+    cur.execute("""
+        CREATE TEMP TABLE grid_100m_stage
+        (geohash TEXT, lat DOUBLE PRECISION, lon DOUBLE PRECISION, geom GEOMETRY(Polygon, 4326))
+        ON COMMIT DROP
+    """)
+    cur.copy_expert("COPY grid_100m_stage (geohash, lat, lon, geom) FROM STDIN WITH CSV", buf)
+    cur.execute("""
+        INSERT INTO grid_100m (geohash, lat, lon, geom)
+        SELECT geohash, lat, lon, geom FROM grid_100m_stage
+        ON CONFLICT (geohash) DO NOTHING
+    """)
+
+    # Keep nearby cells physically close for the joins with climate_daily
+    cluster_grid(cur)
 
     # Commit to database
     conn.commit()
-    conn.close()
+    putconn(conn)
+    closeall()
 
     # Save to GeoJSON
     geojson = {
@@ -90,8 +250,12 @@ if __name__ == "__main__":
         "features": features
     }
 
-    with open(GEOJSON_FILE, "w", encoding="utf-8") as f:
-        json.dump(geojson, f, ensure_ascii=False, indent=2)
+    option = orjson.OPT_APPEND_NEWLINE
+    if args.pretty:
+        option |= orjson.OPT_INDENT_2
+
+    with open(GEOJSON_FILE, "wb") as f:
+        f.write(orjson.dumps(geojson, option=option))
 
     print(f"Grid created successfully: {len(features)} cells")
     print(f"GeoJSON output saved to: {GEOJSON_FILE}")
@@ -3,21 +3,26 @@
 aggregate_7days.py
 Calculate 7-day rolling averages from climate_daily table
 Usage: python aggregate_7days.py [--date YYYY-MM-DD] [--auto]
+
+Requires the climate_daily indexes from schema.sql:
+  - climate_daily_date_brin (BRIN on date)
+  - climate_daily_gh_date_covering ((geohash, date) INCLUDE all climate columns)
+so the 7-day aggregation can run as an index-only scan.
 """
 
 import sys
 import argparse
 import psycopg2
-from psycopg2.extras import execute_values
+from concurrent.futures import ProcessPoolExecutor
 from datetime import date, timedelta, datetime
 from dotenv import load_dotenv
 import os
 
 load_dotenv()
 
-DB_CONFIG = {
-   
-}
+# Import local modules
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from db import DB_CONFIG
 
 def get_db_connection():
     """Create database connection"""
@@ -28,6 +33,29 @@ def get_db_connection():
         print(f"❌ Database connection error: {e}")
         return None
 
+REQUIRED_INDEXES = {
+    'climate_daily_date_brin':
+        "CREATE INDEX IF NOT EXISTS climate_daily_date_brin ON climate_daily USING BRIN(date);",
+    'climate_daily_gh_date_covering':
+        "CREATE INDEX IF NOT EXISTS climate_daily_gh_date_covering ON climate_daily (geohash, date) "
+        "INCLUDE (tmin, tmax, radiation, rain, rh, wind, et0);",
+}
+
+def check_indexes(conn):
+    """Vérifie la présence des index nécessaires sur climate_daily"""
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT indexname FROM pg_indexes
+            WHERE tablename = 'climate_daily' AND indexname = ANY(%s)
+        """, (list(REQUIRED_INDEXES),))
+        existing = {row[0] for row in cur.fetchall()}
+    
+    missing = [name for name in REQUIRED_INDEXES if name not in existing]
+    for name in missing:
+        print(f"⚠️ Index manquant: {name}")
+        print(f"   👉 {REQUIRED_INDEXES[name]}")
+    return not missing
+
 def check_data_availability(conn):
     """Vérifie la disponibilité des données dans climate_daily"""
     with conn.cursor() as cur:
@@ -55,10 +83,51 @@ def check_data_availability(conn):
         
         return True
 
+# Upsert of one 7-day window, prepared once per connection ($1=start, $2=end, $3=min days)
+AGG7_PREPARE_SQL = """
+    PREPARE agg7(date, date, int) AS
+    INSERT INTO climate_7days 
+    (geohash, start_date, end_date, avg_tmin, avg_tmax, 
+     avg_radiation, total_rain, avg_rh, avg_wind, avg_et0)
+    SELECT 
+        geohash,
+        $1,
+        $2,
+        ROUND(AVG(tmin)::numeric, 2),
+        ROUND(AVG(tmax)::numeric, 2),
+        ROUND(AVG(radiation)::numeric, 2),
+        ROUND(SUM(rain)::numeric, 2),
+        ROUND(AVG(rh)::numeric, 2),
+        ROUND(AVG(wind)::numeric, 2),
+        ROUND(AVG(et0)::numeric, 2)
+    FROM climate_daily
+    WHERE date BETWEEN $1 AND $2
+        AND tmin IS NOT NULL
+    GROUP BY geohash
+    HAVING COUNT(*) >= $3
+    ON CONFLICT (geohash, end_date) DO UPDATE
+    SET start_date = EXCLUDED.start_date,
+        avg_tmin = EXCLUDED.avg_tmin,
+        avg_tmax = EXCLUDED.avg_tmax,
+        avg_radiation = EXCLUDED.avg_radiation,
+        total_rain = EXCLUDED.total_rain,
+        avg_rh = EXCLUDED.avg_rh,
+        avg_wind = EXCLUDED.avg_wind,
+        avg_et0 = EXCLUDED.avg_et0,
+        updated_at = NOW()
+"""
+
+def prepare_aggregation(conn):
+    """Prépare la requête agg7 côté serveur (plan mis en cache pour la session)"""
+    with conn.cursor() as cur:
+        cur.execute(AGG7_PREPARE_SQL)
+    conn.commit()
+
 def aggregate_7days(conn, target_date=None, min_days_required=3):
     """
     Calculate 7-day averages ending on target_date
     min_days_required: nombre minimum de jours requis pour calculer une moyenne (défaut: 3)
+    The connection must have been passed to prepare_aggregation() first.
     """
     with conn.cursor() as cur:
         # Si pas de date spécifiée, prendre la dernière date disponible
@@ -94,91 +163,45 @@ def aggregate_7days(conn, target_date=None, min_days_required=3):
             print("⚠️ Aucune donnée dans cette période")
             return 0
         
-        # Récupérer tous les geohash qui ont des données dans la période
-        cur.execute("""
-            SELECT DISTINCT geohash 
-            FROM climate_daily 
-            WHERE date BETWEEN %s AND %s
-            ORDER BY geohash
-        """, (start_date, target_date))
-        
-        grid_points = [row[0] for row in cur.fetchall()]
-        print(f"   {len(grid_points)} geohash à traiter")
+        # Agrégation entièrement côté serveur via la requête préparée agg7
+        cur.execute("EXECUTE agg7(%s, %s, %s)", (start_date, target_date, min_days_required))
         
-        weekly_data = []
-        points_insuffisants = 0
-        
-        # Pour chaque point, calculer les moyennes sur 7 jours
-        for i, geohash in enumerate(grid_points):
-            cur.execute("""
-                SELECT 
-                    COUNT(*) as days_count,
-                    ROUND(AVG(tmin)::numeric, 2) as avg_tmin,
-                    ROUND(AVG(tmax)::numeric, 2) as avg_tmax,
-                    ROUND(AVG(radiation)::numeric, 2) as avg_radiation,
-                    ROUND(SUM(rain)::numeric, 2) as total_rain,
-                    ROUND(AVG(rh)::numeric, 2) as avg_rh,
-                    ROUND(AVG(wind)::numeric, 2) as avg_wind,
-                    ROUND(AVG(et0)::numeric, 2) as avg_et0
-                FROM climate_daily
-                WHERE geohash = %s 
-                    AND date BETWEEN %s AND %s
-                    AND tmin IS NOT NULL
-            """, (geohash, start_date, target_date))
-            
-            row = cur.fetchone()
-            days_count = row[0]
-            
-            # Afficher la progression
-            if (i + 1) % 100 == 0:
-                print(f"      Progression: {i+1}/{len(grid_points)} points...")
-            
-            # 🔥 CORRECTION: Utiliser min_days_required au lieu de 5
-            if days_count >= min_days_required:
-                weekly_data.append((
-                    geohash,
-                    start_date,
-                    target_date,
-                    row[1],  # avg_tmin
-                    row[2],  # avg_tmax
-                    row[3],  # avg_radiation
-                    row[4],  # total_rain
-                    row[5],  # avg_rh
-                    row[6],  # avg_wind
-                    row[7]   # avg_et0
-                ))
-            else:
-                points_insuffisants += 1
+        aggregated = cur.rowcount
+        points_insuffisants = points_count - aggregated
         
-        print(f"   Points avec ≥{min_days_required} jours: {len(weekly_data)}/{len(grid_points)}")
+        print(f"   Points avec ≥{min_days_required} jours: {aggregated}/{points_count}")
         if points_insuffisants > 0:
             print(f"   Points avec moins de {min_days_required} jours: {points_insuffisants}")
         
-        # Insert weekly summaries
-        if weekly_data:
-            execute_values(cur, """
-                INSERT INTO climate_7days 
-                (geohash, start_date, end_date, avg_tmin, avg_tmax, 
-                 avg_radiation, total_rain, avg_rh, avg_wind, avg_et0)
-                VALUES %s
-                ON CONFLICT (geohash, end_date) DO UPDATE
-                SET start_date = EXCLUDED.start_date,
-                    avg_tmin = EXCLUDED.avg_tmin,
-                    avg_tmax = EXCLUDED.avg_tmax,
-                    avg_radiation = EXCLUDED.avg_radiation,
-                    total_rain = EXCLUDED.total_rain,
-                    avg_rh = EXCLUDED.avg_rh,
-                    avg_wind = EXCLUDED.avg_wind,
-                    avg_et0 = EXCLUDED.avg_et0,
-                    updated_at = NOW()
-            """, weekly_data)
-            
+        if aggregated > 0:
             conn.commit()
-            print(f"✅ Aggregated {len(weekly_data)} weekly records")
+            print(f"✅ Aggregated {aggregated} weekly records")
         else:
             print(f"⚠️ No weekly data to aggregate (need at least {min_days_required} days per point)")
         
-        return len(weekly_data)
+        return aggregated
+
+# Connexion du worker courant, ouverte et préparée une seule fois par _init_worker
+_worker_conn = None
+
+def _init_worker():
+    """Initialiseur du pool: une connexion par worker, agg7 préparée une seule fois"""
+    global _worker_conn
+    _worker_conn = get_db_connection()
+    if _worker_conn:
+        prepare_aggregation(_worker_conn)
+
+def _aggregate_one(task):
+    """Worker: agrège une date sur la connexion préparée du worker (backfill parallèle)"""
+    target_date, min_days_required = task
+    if not _worker_conn:
+        return 0
+    try:
+        return aggregate_7days(_worker_conn, target_date, min_days_required)
+    except Exception as e:
+        print(f"❌ Error ({target_date}): {e}")
+        _worker_conn.rollback()
+        return 0
 
 def verify_aggregation(conn):
     """Vérifie les résultats dans climate_7days"""
@@ -244,7 +267,8 @@ def main():
         sys.exit(1)
     
     try:
-        # Vérifier la disponibilité des données
+        # Vérifier les index et la disponibilité des données
+        check_indexes(conn)
         if not check_data_availability(conn):
             sys.exit(1)
         
@@ -288,10 +312,20 @@ def main():
         
         # Traiter chaque date
         total_aggregated = 0
-        for i, target_date in enumerate(dates_to_process):
-            print(f"\n--- Période {i+1}/{len(dates_to_process)} ---")
-            count = aggregate_7days(conn, target_date, args.min_days)
-            total_aggregated += count
+        if len(dates_to_process) > 1:
+            # Les périodes sont indépendantes: une connexion préparée par worker,
+            # réutilisée pour toutes les dates qu'il traite
+            workers = min(len(dates_to_process), os.cpu_count() or 1)
+            print(f"\n⚙️ Backfill parallèle sur {workers} workers")
+            tasks = [(d, args.min_days) for d in dates_to_process]
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor:
+                total_aggregated = sum(executor.map(_aggregate_one, tasks))
+        else:
+            prepare_aggregation(conn)
+            for i, target_date in enumerate(dates_to_process):
+                print(f"\n--- Période {i+1}/{len(dates_to_process)} ---")
+                count = aggregate_7days(conn, target_date, args.min_days)
+                total_aggregated += count
         
         # Vérifier les résultats
         verify_aggregation(conn)
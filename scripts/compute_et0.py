@@ -6,13 +6,29 @@ with Excel export for all grid points
 """
 
 import math
-import json
+import argparse
+import shutil
+import numpy as np
+import orjson
 import pandas as pd
+import xlsxwriter
 from datetime import datetime
 import os
 
+# Numba is optional: when available the ET0 kernel is JIT-compiled and parallelized
+try:
+    from numba import njit, prange
+    HAS_NUMBA = True
+except ImportError:
+    HAS_NUMBA = False
+
 ALTITUDE_DEFAULT = 143  # Jendouba altitude (m)
 
+# xlsxwriter in constant_memory mode streams rows to disk instead of building the sheet in RAM.
+# Rows must then be written strictly in order (see export_to_excel): pandas.to_excel writes
+# column by column and would lose every cell of an already flushed row.
+EXCEL_WORKBOOK_OPTIONS = {'constant_memory': True}
+
 def saturation_vapor_pressure(T):
     """Calculate saturation vapor pressure (kPa)"""
     if T is None:
@@ -30,6 +46,9 @@ def psychrometric_constant(alt):
     P = 101.3 * ((293 - 0.0065 * alt) / 293) ** 5.26
     return 0.000665 * P
 
+# Psychrometric constant at the default altitude, computed once
+GAMMA_DEFAULT = psychrometric_constant(ALTITUDE_DEFAULT)
+
 def compute_et0(tmin, tmax, solar_rad, rh, wind, altitude=ALTITUDE_DEFAULT):
     """
     Calculate reference evapotranspiration (ET0) using FAO-56 Penman-Monteith
@@ -52,7 +71,7 @@ def compute_et0(tmin, tmax, solar_rad, rh, wind, altitude=ALTITUDE_DEFAULT):
     delta = delta_svp(tmean)
     
     # Psychrometric constant
-    gamma = psychrometric_constant(altitude)
+    gamma = GAMMA_DEFAULT if altitude == ALTITUDE_DEFAULT else psychrometric_constant(altitude)
     
     # Radiation terms
     Rn = solar_rad  # MJ/m²/day
@@ -71,73 +90,144 @@ def compute_et0(tmin, tmax, solar_rad, rh, wind, altitude=ALTITUDE_DEFAULT):
     except Exception:
         return None
 
+if HAS_NUMBA:
+    # fastmath without 'nnan'/'ninf' so that missing values (NaN) are still detected
+    @njit(parallel=True, fastmath={'nsz', 'arcp', 'contract', 'afn', 'reassoc'}, cache=True)
+    def _et0_kernel(tmin, tmax, solar_rad, rh, wind, gamma):
+        """FAO-56 Penman-Monteith ET0 kernel over contiguous float64 arrays"""
+        n = tmin.shape[0]
+        out = np.empty(n, dtype=np.float64)
+        for i in prange(n):
+            if (np.isnan(tmin[i]) or np.isnan(tmax[i]) or np.isnan(solar_rad[i])
+                    or np.isnan(rh[i]) or np.isnan(wind[i]) or solar_rad[i] < 0):
+                out[i] = np.nan
+                continue
+            tmean = (tmin[i] + tmax[i]) / 2
+            es = 0.6108 * np.exp((17.27 * tmean) / (tmean + 237.3))
+            ea = es * (rh[i] / 100)
+            delta = (4098 * es) / ((tmean + 237.3) ** 2)
+            numerator1 = 0.408 * delta * solar_rad[i]
+            numerator2 = gamma * (900 / (tmean + 273)) * wind[i] * (es - ea)
+            denominator = delta + gamma * (1 + 0.34 * wind[i])
+            out[i] = max((numerator1 + numerator2) / denominator, 0.0)
+        return out
+
+def compute_et0_vec(tmin, tmax, solar_rad, rh, wind, altitude=ALTITUDE_DEFAULT):
+    """
+    Vectorized FAO-56 Penman-Monteith ET0 over arrays (NaN where inputs are missing)
+    """
+    tmin = np.ascontiguousarray(tmin, dtype=np.float64)
+    tmax = np.ascontiguousarray(tmax, dtype=np.float64)
+    solar_rad = np.ascontiguousarray(solar_rad, dtype=np.float64)
+    rh = np.ascontiguousarray(rh, dtype=np.float64)
+    wind = np.ascontiguousarray(wind, dtype=np.float64)
+    
+    gamma = GAMMA_DEFAULT if altitude == ALTITUDE_DEFAULT else psychrometric_constant(altitude)
+    
+    if HAS_NUMBA:
+        return np.round(_et0_kernel(tmin, tmax, solar_rad, rh, wind, gamma), 2)
+    
+    tmean = (tmin + tmax) / 2
+    
+    # Vapor pressure and slope of saturation vapor pressure curve
+    es = 0.6108 * np.exp((17.27 * tmean) / (tmean + 237.3))
+    ea = es * (rh / 100)
+    delta = (4098 * es) / ((tmean + 237.3) ** 2)
+    
+    # FAO-56 Penman-Monteith equation (G = 0)
+    numerator1 = 0.408 * delta * solar_rad
+    numerator2 = gamma * (900 / (tmean + 273)) * wind * (es - ea)
+    denominator = delta + gamma * (1 + 0.34 * wind)
+    
+    with np.errstate(invalid='ignore', divide='ignore'):
+        et0 = (numerator1 + numerator2) / denominator
+    
+    # Negative radiation is invalid; ET0 cannot be negative
+    et0 = np.where(solar_rad < 0, np.nan, et0)
+    return np.round(np.maximum(et0, 0), 2)
+
 def process_json_file(json_path, output_excel=None):
     """
     Lit le fichier JSON, calcule ET0 pour tous les points
     """
     print(f"📖 Lecture du fichier: {json_path}")
     
-    with open(json_path, 'r', encoding='utf-8') as f:
-        data = json.load(f)
+    with open(json_path, 'rb') as f:
+        data = orjson.loads(f.read())
+    
+    points = data.get('results', [])
+    total_points = len(points)
+    
+    n_days = max((len(p.get('weather_data', [])) for p in points), default=0)
     
-    results = []
-    total_points = len(data.get('results', []))
-    valid_count = 0
+    # Tableaux pré-alloués (SoA): une ligne par point, une colonne par jour
+    geohashes = np.empty(total_points, dtype=object)
+    lats = np.full(total_points, np.nan)
+    lons = np.full(total_points, np.nan)
+    dates_2d = np.empty((total_points, n_days), dtype=object)
+    tmin_2d = np.full((total_points, n_days), np.nan)
+    tmax_2d = np.full((total_points, n_days), np.nan)
+    radiation_2d = np.full((total_points, n_days), np.nan)
+    rh_2d = np.full((total_points, n_days), np.nan)
+    wind_2d = np.full((total_points, n_days), np.nan)
     
-    for i, point in enumerate(data.get('results', [])):
+    for i, point in enumerate(points):
         geohash = point.get('geohash')
-        lat = point.get('latitude')
-        lon = point.get('longitude')
+        geohashes[i] = str(geohash) if geohash else ''
+        lats[i] = point.get('latitude')
+        lons[i] = point.get('longitude')
         
-        weather_data = point.get('weather_data', [])
-        
-        # Prendre le PREMIER jour avec des données valides
-        selected_day = None
-        for day in weather_data:
-            if (day.get('tmin') is not None and 
-                day.get('tmax') is not None and 
-                day.get('radiation') is not None and 
-                day.get('rh') is not None and 
-                day.get('wind') is not None):
-                selected_day = day
-                break
-        
-        if selected_day:
-            tmin = selected_day.get('tmin')
-            tmax = selected_day.get('tmax')
-            radiation = selected_day.get('radiation')
-            rh = selected_day.get('rh')
-            wind = selected_day.get('wind')
-            
-            # Calculer ET0
-            et0 = compute_et0(tmin, tmax, radiation, rh, wind)
-            
-            if et0 is not None:
-                valid_count += 1
-            
-            results.append({
-                'geohash': str(geohash) if geohash else '',
-                'latitude': lat,
-                'longitude': lon,
-                'date': selected_day.get('date'),
-                'tmin': tmin,
-                'tmax': tmax,
-                'radiation': radiation,
-                'rh': rh,
-                'wind': wind,
-                'et0': et0
-            })
+        for j, day in enumerate(point.get('weather_data', [])):
+            dates_2d[i, j] = day.get('date')
+            tmin_2d[i, j] = day.get('tmin')
+            tmax_2d[i, j] = day.get('tmax')
+            radiation_2d[i, j] = day.get('radiation')
+            rh_2d[i, j] = day.get('rh')
+            wind_2d[i, j] = day.get('wind')
         
         # Progression
         if (i+1) % 500 == 0:
             print(f"   Progression: {i+1}/{total_points} points...")
     
-    # Créer DataFrame
-    df = pd.DataFrame(results)
+    # Prendre le PREMIER jour avec des données valides (masque vectorisé)
+    valid_mask = ~(np.isnan(tmin_2d) | np.isnan(tmax_2d) | np.isnan(radiation_2d)
+                   | np.isnan(rh_2d) | np.isnan(wind_2d))
+    has_any = valid_mask.any(axis=1)
+    rows = np.flatnonzero(has_any)
+    first_valid = valid_mask[rows].argmax(axis=1) if n_days else np.zeros(0, dtype=np.intp)
+    n = len(rows)
+    
+    geohashes = geohashes[rows]
+    lats = lats[rows]
+    lons = lons[rows]
+    dates = dates_2d[rows, first_valid]
+    tmins = tmin_2d[rows, first_valid]
+    tmaxs = tmax_2d[rows, first_valid]
+    radiations = radiation_2d[rows, first_valid]
+    rhs = rh_2d[rows, first_valid]
+    winds = wind_2d[rows, first_valid]
+    
+    # Calculer ET0 en une seule passe vectorisée sur les colonnes
+    et0 = compute_et0_vec(tmins, tmaxs, radiations, rhs, winds)
+    valid_count = int(np.count_nonzero(~np.isnan(et0)))
+    
+    # Créer DataFrame à partir des colonnes
+    df = pd.DataFrame({
+        'geohash': geohashes,
+        'latitude': lats,
+        'longitude': lons,
+        'date': dates,
+        'tmin': tmins,
+        'tmax': tmaxs,
+        'radiation': radiations,
+        'rh': rhs,
+        'wind': winds,
+        'et0': et0
+    })
     
     print(f"\n✅ Calcul terminé!")
-    print(f"   Total points: {len(results)}")
-    print(f"   ET0 valides: {valid_count}/{len(results)}")
+    print(f"   Total points: {n}")
+    print(f"   ET0 valides: {valid_count}/{n}")
     
     return df
 
@@ -153,15 +243,23 @@ def export_to_excel(df, output_path=None):
     # Créer le dossier output s'il n'existe pas
     os.makedirs(os.path.dirname(output_path) if os.path.dirname(output_path) else '.', exist_ok=True)
     
-    # Exporter vers Excel
-    df.to_excel(output_path, index=False, sheet_name='ET0_Calculations')
+    # Exporter vers Excel, ligne par ligne (NaN -> cellule vide, comme pandas)
+    columns = [df[name].astype(object).where(df[name].notna(), None).tolist() for name in df.columns]
+    workbook = xlsxwriter.Workbook(output_path, EXCEL_WORKBOOK_OPTIONS)
+    try:
+        worksheet = workbook.add_worksheet('ET0_Calculations')
+        worksheet.write_row(0, 0, list(df.columns), workbook.add_format({'bold': True, 'border': 1}))
+        for row, values in enumerate(zip(*columns), start=1):
+            worksheet.write_row(row, 0, values)
+    finally:
+        workbook.close()
     
     print(f"📁 Fichier Excel: {output_path}")
     return output_path
 
-def export_to_desktop(df, filename='et0_all_grid_points.xlsx'):
+def export_to_desktop(source_path, filename='et0_all_grid_points.xlsx'):
     """
-    Exporte le DataFrame vers le Bureau
+    Copie le fichier Excel déjà généré vers le Bureau (sans re-sérialiser)
     """
     desktop = r'C:\Users\Lenovo\Desktop'
     
@@ -173,7 +271,7 @@ def export_to_desktop(df, filename='et0_all_grid_points.xlsx'):
         output_path = os.path.join(desktop, f"{name}_{counter}{ext}")
         counter += 1
     
-    df.to_excel(output_path, index=False)
+    shutil.copy2(source_path, output_path)
     print(f"✅ Bureau: {output_path}")
     return output_path
 
@@ -189,8 +287,8 @@ def test_single_point():
     try:
         json_file = "output/weather_data_all_grid_points.json"
         if os.path.exists(json_file):
-            with open(json_file, 'r') as f:
-                data = json.load(f)
+            with open(json_file, 'rb') as f:
+                data = orjson.loads(f.read())
             
             if data.get('results') and len(data['results']) > 0:
                 first_point = data['results'][0]
@@ -226,6 +324,12 @@ def test_single_point():
 
 def main():
     """Fonction principale"""
+    parser = argparse.ArgumentParser(description='Compute ET0 for all grid points')
+    parser.add_argument('--export-desktop', action='store_true',
+                       help='Also copy the Excel file to the Desktop')
+    
+    args = parser.parse_args()
+    
     print("="*60)
     print("🌍 CALCUL ET0 - FAO-56 Penman-Monteith")
     print("="*60)
@@ -252,8 +356,10 @@ def main():
     # 3. Exporter vers le dossier output
     output_file = export_to_excel(df)
     
-    # 4. Exporter vers le Bureau
-    desktop_file = export_to_desktop(df, 'et0_all_grid_points.xlsx')
+    # 4. Copier vers le Bureau (optionnel)
+    desktop_file = None
+    if args.export_desktop:
+        desktop_file = export_to_desktop(output_file, 'et0_all_grid_points.xlsx')
     
     # 5. Afficher les statistiques
     valid_et0 = df['et0'].notna().sum()
@@ -266,7 +372,8 @@ def main():
     
     print(f"\n✅ Export terminé!")
     print(f"   - Dossier output: {output_file}")
-    print(f"   - Bureau: {desktop_file}")
+    if desktop_file:
+        print(f"   - Bureau: {desktop_file}")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""
+db.py
+Shared PostgreSQL configuration (read from .env) and connection pool
+"""
+
+import os
+from dotenv import load_dotenv
+from psycopg2.pool import ThreadedConnectionPool
+
+load_dotenv(os.path.join(os.path.dirname(os.path.abspath(__file__)), '.env'))
+
+# Database configuration (empty values fall back to libpq defaults)
+DB_CONFIG = {
+    'host': os.getenv('DB_HOST') or None,
+    'port': os.getenv('DB_PORT') or None,
+    'dbname': os.getenv('DB_NAME') or None,
+    'user': os.getenv('DB_USER') or None,
+    'password': os.getenv('DB_PASSWORD') or None,
+    # TCP keepalives so long aggregation/ingestion runs are not dropped
+    'keepalives': 1,
+    'keepalives_idle': 30,
+}
+
+# Upper bound on pooled connections (one per concurrent COPY stream + main thread)
+POOL_MAX_CONN = 8
+
+_pool = None
+
+def get_pool():
+    """Return the process-wide connection pool, creating it on first use"""
+    global _pool
+    if _pool is None:
+        _pool = ThreadedConnectionPool(minconn=1, maxconn=POOL_MAX_CONN, **DB_CONFIG)
+    return _pool
+
+def getconn():
+    """Borrow a connection from the pool"""
+    return get_pool().getconn()
+
+def putconn(conn):
+    """Return a connection to the pool"""
+    get_pool().putconn(conn)
+
+def closeall():
+    """Close every pooled connection"""
+    global _pool
+    if _pool is not None:
+        _pool.closeall()
+        _pool = None
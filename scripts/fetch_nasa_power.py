@@ -1,75 +1,421 @@
+import os
+import sys
+import queue
+import argparse
+import numpy as np
 import requests
-import json
+import orjson
+import threading
 from datetime import date, timedelta
 from concurrent.futures import ThreadPoolExecutor, as_completed
 import time
+import asyncio
+import importlib.util
+from functools import lru_cache
+from typing import Optional
+from urllib.parse import urlencode
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# httpx is optional: without it the fetch falls back to the thread pool
+try:
+    import httpx
+    HAS_HTTPX = True
+except ImportError:
+    HAS_HTTPX = False
+HAS_HTTP2 = importlib.util.find_spec("h2") is not None
+
+# pysimdjson is optional: lazy proxies only materialize the fields actually read
+try:
+    import simdjson
+    HAS_SIMDJSON = True
+except ImportError:
+    HAS_SIMDJSON = False
+
+# msgspec is optional: a typed decoder only materializes properties.parameter
+try:
+    import msgspec
+    HAS_MSGSPEC = True
+except ImportError:
+    HAS_MSGSPEC = False
+
+# Numba is optional: the -999 sweep is JIT-compiled (and runs without the GIL)
+try:
+    from numba import njit
+    HAS_NUMBA = True
+except ImportError:
+    HAS_NUMBA = False
+
+# ijson is optional: grid files larger than this are streamed feature by feature
+try:
+    import ijson
+    HAS_IJSON = True
+    JSON_ERRORS = (ValueError, ijson.JSONError)
+except ImportError:
+    HAS_IJSON = False
+    JSON_ERRORS = (ValueError,)
+STREAM_THRESHOLD_BYTES = 256 * 1024 * 1024
+
+# Import local modules
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from db import getconn, putconn, closeall
+from ingest_climate import COPY_WRITERS, stream_ingest
+
+ASYNC_CONCURRENCY = 32  # max in-flight POWER requests
+
+# Retry policy shared by the requests session and the async client
+RETRY_TOTAL = 3
+RETRY_BACKOFF_FACTOR = 0.5  # sleeps 0.5s, 1s, 2s between attempts
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+STREAM_QUEUE_SIZE = 1000  # fetched points buffered ahead of the DB writer (--to-db)
+
+# -----------------------------
+# Persistent HTTP session (one per worker thread)
+# -----------------------------
+_thread_local = threading.local()
+
+def get_session():
+    """
+    Return this thread's keep-alive Session so the TCP/TLS connection to
+    power.larc.nasa.gov is reused across grid points.
+    """
+    session = getattr(_thread_local, "session", None)
+    if session is None:
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=10,
+            pool_maxsize=50,
+            max_retries=Retry(total=RETRY_TOTAL, backoff_factor=RETRY_BACKOFF_FACTOR,
+                              status_forcelist=list(RETRY_STATUSES))
+        )
+        session.mount("https://", adapter)
+        session.headers["Connection"] = "keep-alive"
+        session.headers["Accept-Encoding"] = "gzip"
+        _thread_local.session = session
+    return session
+
 # -----------------------------
 # NASA POWER data fetch function
 # -----------------------------
+# Output field -> POWER parameter
+POWER_PARAMETERS = {
+    "tmin": "T2M_MIN",
+    "tmax": "T2M_MAX",
+    "radiation": "ALLSKY_SFC_SW_DWN",
+    "rain": "PRECTOTCORR",
+    "rh": "RH2M",
+    "wind": "WS2M",
+}
+
+POWER_URL = "https://power.larc.nasa.gov/api/temporal/daily/point"
+
+# Use last available data (usually yesterday or earlier): 3 days back to be safe
+DATA_END_DATE = date.today() - timedelta(days=3)
+
+@lru_cache(maxsize=None)
+def _base_url(days):
+    """URL prefix shared by every point for a given window length (built once)."""
+    start_date = DATA_END_DATE - timedelta(days=days-1)
+    query = urlencode({
+        "parameters": ",".join(POWER_PARAMETERS.values()),
+        "community": "AG",
+        "format": "JSON",
+        "start": start_date.strftime('%Y%m%d'),
+        "end": DATA_END_DATE.strftime('%Y%m%d'),
+    }, safe=",")
+    return f"{POWER_URL}?{query}"
+
+def build_url(lat, lon, days=3):
+    """Build the NASA POWER daily point URL ending on the last available day."""
+    return f"{_base_url(days)}&latitude={lat}&longitude={lon}"
+
+if HAS_MSGSPEC:
+    class PowerProperties(msgspec.Struct):
+        """properties subtree of a POWER response: parameter -> {YYYYMMDD: value}"""
+        parameter: dict[str, dict[str, Optional[float]]] = {}
+
+    class PowerResponse(msgspec.Struct):
+        """Only the fields we read; header, geometry, messages... are skipped unparsed"""
+        properties: PowerProperties = msgspec.field(default_factory=PowerProperties)
+
+    _power_decoder = msgspec.json.Decoder(PowerResponse)
+    POWER_DECODE_ERRORS = (ValueError, TypeError, msgspec.DecodeError)
+else:
+    POWER_DECODE_ERRORS = (ValueError, TypeError)
+
+def decode_power_parameters(content):
+    """Decode a POWER response body to its {parameter: {date: value}} mapping."""
+    if HAS_MSGSPEC:
+        return _power_decoder.decode(content).properties.parameter
+    return orjson.loads(content).get("properties", {}).get("parameter", {})
+
+POWER_FILL_VALUE = -999.0  # POWER sentinel for missing values
+
+if HAS_NUMBA:
+    @njit(cache=True, nogil=True)
+    def sentinel_to_nan(a):
+        """Replace POWER -999 sentinels with NaN in place (2D float64 array)."""
+        rows, cols = a.shape
+        for i in range(rows):
+            for j in range(cols):
+                if a[i, j] == POWER_FILL_VALUE:
+                    a[i, j] = np.nan
+        return a
+else:
+    def sentinel_to_nan(a):
+        """Replace POWER -999 sentinels with NaN in place (2D float64 array)."""
+        a[a == POWER_FILL_VALUE] = np.nan
+        return a
+
+def parse_power_response(data, lat, lon):
+    """Turn POWER parameter data into daily records, replacing -999 values with None."""
+    if not data or "T2M_MIN" not in data:
+        print(f"No data returned for lat={lat}, lon={lon}")
+        return []
+
+    # One (6, D) array for all parameters; -999 sentinels (and missing days) masked at once
+    date_keys = list(data["T2M_MIN"].keys())
+    values = np.array([
+        [data.get(param, {}).get(date_key) for date_key in date_keys]
+        for param in POWER_PARAMETERS.values()
+    ], dtype=np.float64)
+    sentinel_to_nan(values)
+    columns = values.astype(object)
+    columns[np.isnan(values)] = None
+
+    fields = list(POWER_PARAMETERS.keys())
+    return [
+        {"date": date_key, **dict(zip(fields, day_values))}
+        for date_key, day_values in zip(date_keys, zip(*columns.tolist()))
+    ]
+
+# -----------------------------
+# On-disk response cache (raw JSON bytes keyed by point and window)
+# -----------------------------
+POWER_CACHE_DIR = "output/power_cache"
+USE_CACHE = True  # disabled with --no-cache
+
+def _cache_path(lat, lon, days):
+    """Cache file for one point / date window (the end date is part of the key)."""
+    key = f"{round(lat, 4)}_{round(lon, 4)}_{DATA_END_DATE.strftime('%Y%m%d')}_{days}"
+    return os.path.join(POWER_CACHE_DIR, f"{key}.json")
+
+def read_cache(lat, lon, days):
+    """Return the cached response body, or None on a miss."""
+    if not USE_CACHE:
+        return None
+    try:
+        with open(_cache_path(lat, lon, days), 'rb') as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+def drop_cache(lat, lon, days):
+    """Delete a cache entry (e.g. truncated or not a usable POWER response)."""
+    try:
+        os.remove(_cache_path(lat, lon, days))
+    except FileNotFoundError:
+        pass
+
+def write_cache(lat, lon, days, content):
+    """Store a response body (written to a temp file, then renamed atomically)."""
+    if not USE_CACHE:
+        return
+    path = _cache_path(lat, lon, days)
+    os.makedirs(POWER_CACHE_DIR, exist_ok=True)
+    tmp_path = f"{path}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+
+MAX_RESPONSE_BYTES = 5 * 1024 * 1024  # a 7-day point response is ~20 KB (a few KB gzipped)
+READ_CHUNK_BYTES = 64 * 1024
+
+def has_usable_body(headers, lat, lon):
+    """
+    Content-Length short-circuit: skip empty or oversized responses before the
+    body is downloaded or decoded. Bodies without the header (chunked) are
+    capped while they are read, see append_capped.
+    """
+    length = headers.get("Content-Length")
+    if length is None:
+        return True
+    if int(length) == 0:
+        print(f"Empty response for lat={lat}, lon={lon}")
+        return False
+    if int(length) > MAX_RESPONSE_BYTES:
+        print(f"Response too large for lat={lat}, lon={lon}: {length} bytes")
+        return False
+    return True
+
+def append_capped(body, chunk, lat, lon):
+    """Add a decoded body chunk; False once the body exceeds MAX_RESPONSE_BYTES."""
+    body += chunk
+    if len(body) > MAX_RESPONSE_BYTES:
+        print(f"Response too large for lat={lat}, lon={lon}: over {MAX_RESPONSE_BYTES} bytes")
+        return False
+    return True
+
+def parse_body(content, lat, lon):
+    """Decode and parse a POWER response body; None when it cannot be decoded."""
+    try:
+        return parse_power_response(decode_power_parameters(content), lat, lon)
+    except POWER_DECODE_ERRORS as e:
+        print(f"Invalid response for lat={lat}, lon={lon}: {e}")
+        return None
+
+def read_cached_data(lat, lon, days):
+    """Daily records from the cache, or None on a miss (unusable entries are deleted)."""
+    content = read_cache(lat, lon, days)
+    if content is None:
+        return None
+    daily_data = parse_body(content, lat, lon)
+    if daily_data:
+        return daily_data
+    drop_cache(lat, lon, days)
+    return None
+
+def cache_fetched_data(lat, lon, days, content):
+    """Parse a fetched body and cache it only when it yields daily records."""
+    daily_data = parse_body(content, lat, lon)
+    if not daily_data:
+        return []
+    write_cache(lat, lon, days, content)
+    return daily_data
+
 def fetch_data(lat, lon, days=3):
     """
     Fetch daily NASA POWER data for a given latitude/longitude.
     Automatically uses last available days to avoid 422 errors.
     Replaces -999 values with None.
     """
-    # Use last available data (usually yesterday or earlier)
-    end_date = date.today() - timedelta(days=3)  # 3 days back to be safe
-    start_date = end_date - timedelta(days=days-1)
-
-    url = (
-        "https://power.larc.nasa.gov/api/temporal/daily/point"
-        f"?parameters=T2M_MAX,T2M_MIN,PRECTOTCORR,ALLSKY_SFC_SW_DWN,RH2M,WS2M"
-        f"&community=AG"
-        f"&start={start_date.strftime('%Y%m%d')}"
-        f"&end={end_date.strftime('%Y%m%d')}"
-        f"&latitude={lat}&longitude={lon}&format=JSON"
-    )
+    daily_data = read_cached_data(lat, lon, days)
+    if daily_data is not None:
+        return daily_data
+
+    url = build_url(lat, lon, days)
 
     try:
-        response = requests.get(url, timeout=30)
-        response.raise_for_status()
+        # stream=True: headers first, so the body is only read when it is worth decoding
+        with get_session().get(url, timeout=30, stream=True) as response:
+            response.raise_for_status()
+            if not has_usable_body(response.headers, lat, lon):
+                return []
+            # gzip decoded transparently; read in chunks so the cap holds without Content-Length
+            body = bytearray()
+            for chunk in response.iter_content(chunk_size=READ_CHUNK_BYTES):
+                if not append_capped(body, chunk, lat, lon):
+                    return []
+            content = bytes(body)
     except requests.RequestException as e:
         print(f"Request error for lat={lat}, lon={lon}: {e}")
         return []
 
-    data = response.json().get("properties", {}).get("parameter", {})
-    if not data or "T2M_MIN" not in data:
-        print(f"No data returned for lat={lat}, lon={lon}")
-        return []
+    return cache_fetched_data(lat, lon, days, content)
+
+# -----------------------------
+# Async fetch (httpx, bounded concurrency)
+# -----------------------------
+def _retry_delay(attempt, response=None):
+    """Backoff before retry number attempt (0-based); honours a numeric Retry-After."""
+    retry_after = response.headers.get("Retry-After") if response is not None else None
+    if retry_after and retry_after.isdigit():
+        return float(retry_after)
+    return RETRY_BACKOFF_FACTOR * (2 ** attempt)
+
+async def fetch_data_async(client, lat, lon, days=3):
+    """
+    Async variant of fetch_data sharing one httpx connection pool.
+    Retries 429/5xx and transport errors with the same policy as the requests session.
+    """
+    daily_data = read_cached_data(lat, lon, days)
+    if daily_data is not None:
+        return daily_data
+
+    url = build_url(lat, lon, days)
+
+    for attempt in range(RETRY_TOTAL + 1):
+        try:
+            async with client.stream("GET", url) as response:
+                if response.status_code in RETRY_STATUSES and attempt < RETRY_TOTAL:
+                    await asyncio.sleep(_retry_delay(attempt, response))
+                    continue
+                response.raise_for_status()
+                if not has_usable_body(response.headers, lat, lon):
+                    return []
+                body = bytearray()
+                async for chunk in response.aiter_bytes(READ_CHUNK_BYTES):
+                    if not append_capped(body, chunk, lat, lon):
+                        return []
+                content = bytes(body)
+                break
+        except httpx.TransportError as e:
+            if attempt < RETRY_TOTAL:
+                await asyncio.sleep(_retry_delay(attempt))
+                continue
+            print(f"Request error for lat={lat}, lon={lon}: {e}")
+            return []
+        except httpx.HTTPError as e:
+            print(f"Request error for lat={lat}, lon={lon}: {e}")
+            return []
+
+    return cache_fetched_data(lat, lon, days, content)
 
-    results = []
-    for date_key in data["T2M_MIN"].keys():
-        # Replace -999 with None
-        results.append({
-            "date": date_key,
-            "tmin": None if data["T2M_MIN"].get(date_key) == -999.0 else data["T2M_MIN"].get(date_key),
-            "tmax": None if data["T2M_MAX"].get(date_key) == -999.0 else data["T2M_MAX"].get(date_key),
-            "radiation": None if data["ALLSKY_SFC_SW_DWN"].get(date_key) == -999.0 else data["ALLSKY_SFC_SW_DWN"].get(date_key),
-            "rain": None if data["PRECTOTCORR"].get(date_key) == -999.0 else data["PRECTOTCORR"].get(date_key),
-            "rh": None if data["RH2M"].get(date_key) == -999.0 else data["RH2M"].get(date_key),
-            "wind": None if data["WS2M"].get(date_key) == -999.0 else data["WS2M"].get(date_key),
-        })
+async def fetch_all_async(grid_points, days=7, concurrency=ASYNC_CONCURRENCY, on_result=None):
+    """
+    Fetch every grid point concurrently; results are in grid_points order.
+    With on_result(i, daily_data), each result is handed over as soon as it
+    arrives instead of being kept (the returned list is then all None).
+    on_result may block (e.g. on a full queue): it runs on a single handoff
+    thread, never on the event loop, and the point keeps its concurrency slot
+    until it returns so a slow consumer throttles new requests.
+    """
+    sem = asyncio.Semaphore(concurrency)
+    loop = asyncio.get_running_loop()
+
+    async def fetch_one(i, p):
+        async with sem:
+            daily_data = await fetch_data_async(client, p["coordinates"][0], p["coordinates"][1], days)
+            if on_result is None:
+                return daily_data
+            await loop.run_in_executor(handoff, on_result, i, daily_data)
 
-    return results
+    limits = httpx.Limits(max_connections=64, max_keepalive_connections=32)
+    with ThreadPoolExecutor(max_workers=1) as handoff:
+        async with httpx.AsyncClient(http2=HAS_HTTP2, limits=limits, timeout=30,
+                                     headers={"Accept-Encoding": "gzip"}) as client:
+            return await asyncio.gather(*[fetch_one(i, p) for i, p in enumerate(grid_points)])
 
 # -----------------------------
 # Load grid points from GeoJSON
 # -----------------------------
+def _iter_features(geojson_path):
+    """
+    Yield GeoJSON features: streamed with ijson for files too large to hold in
+    memory, otherwise parsed at once (simdjson proxies or orjson).
+    """
+    with open(geojson_path, 'rb') as f:
+        if HAS_IJSON and os.path.getsize(geojson_path) > STREAM_THRESHOLD_BYTES:
+            yield from ijson.items(f, 'features.item', use_float=True)
+            return
+        raw = f.read()
+    geojson_data = simdjson.Parser().parse(raw) if HAS_SIMDJSON else orjson.loads(raw)
+    yield from geojson_data.get('features', [])
+
 def load_grid_points(geojson_path):
     """Load center coordinates from GeoJSON grid file."""
     try:
-        with open(geojson_path, 'r') as f:
-            geojson_data = json.load(f)
-        
         points = []
-        for feature in geojson_data.get('features', []):
+        for feature in _iter_features(geojson_path):
             properties = feature.get('properties', {})
             if 'center_lat' in properties and 'center_lon' in properties:
+                bbox = feature.get('geometry', {}).get('coordinates', [])
                 points.append({
                     "name": f"grid_{properties.get('geohash', 'unknown')}",
                     "coordinates": [properties['center_lat'], properties['center_lon']],
                     "geohash": properties.get('geohash'),
-                    "bbox": feature.get('geometry', {}).get('coordinates', [])
+                    # bbox is written back out, so materialize simdjson proxies as plain lists
+                    "bbox": bbox.as_list() if hasattr(bbox, 'as_list') else bbox
                 })
         
         print(f"Loaded {len(points)} grid points from {geojson_path}")
@@ -77,26 +423,67 @@ def load_grid_points(geojson_path):
     except FileNotFoundError:
         print(f"Error: File {geojson_path} not found")
         return []
-    except json.JSONDecodeError:
+    except JSON_ERRORS:
         print(f"Error: Invalid JSON in {geojson_path}")
         return []
 
 # -----------------------------
 # Save results to JSON
 # -----------------------------
-def save_results(results, output_path):
-    """Save all fetched weather data to a JSON file."""
+def save_results(results, output_path, pretty=False):
+    """Save all fetched weather data to a compact JSON file (indented when pretty=True)."""
+    option = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+    if pretty:
+        option |= orjson.OPT_INDENT_2
     try:
-        with open(output_path, 'w') as f:
-            json.dump(results, f, indent=2)
+        with open(output_path, 'wb') as f:
+            f.write(orjson.dumps(results, option=option))
         print(f"Results saved to {output_path}")
     except Exception as e:
         print(f"Error saving results: {e}")
 
+# -----------------------------
+# Per-point report
+# -----------------------------
+def build_result_entry(point, i, total, daily_data):
+    """Print the fetch outcome for one grid point; return its result entry (None on failure)."""
+    lat, lon = point["coordinates"]
+    print(f"\nResult for {point['name']} ({i+1}/{total}) - lat: {lat:.6f}, lon: {lon:.6f}")
+    
+    if not daily_data:
+        print(f"  ✗ No data fetched")
+        return None
+    
+    # Print summary for this point
+    print(f"  ✓ Success - {len(daily_data)} days fetched")
+    
+    # Optional: Print first day's data as sample
+    sample = daily_data[0]
+    print(f"  Sample: {sample['date']} - Tmin: {sample['tmin']:.1f}°C, Tmax: {sample['tmax']:.1f}°C, Rain: {sample['rain']}mm")
+    
+    return {
+        "point_name": point["name"],
+        "geohash": point.get("geohash"),
+        "latitude": lat,
+        "longitude": lon,
+        "bbox": point.get("bbox"),
+        "weather_data": daily_data
+    }
+
 # -----------------------------
 # Main execution
 # -----------------------------
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Fetch NASA POWER daily data for every grid point')
+    parser.add_argument('--to-db', action='store_true',
+                       help='Stream results straight into PostgreSQL instead of writing the JSON file')
+    parser.add_argument('--no-grid', action='store_true',
+                       help='With --to-db, skip grid_100m upserts')
+    parser.add_argument('--no-cache', action='store_true',
+                       help=f'Always query POWER instead of reusing responses cached in {POWER_CACHE_DIR}')
+    args = parser.parse_args()
+    USE_CACHE = not args.no_cache
+    
     # Load grid points from GeoJSON
     geojson_file = "output/grid_100m.geojson"
     grid_points = load_grid_points(geojson_file)
@@ -108,55 +495,98 @@ if __name__ == "__main__":
     # Fetch data for all grid points
     all_results = []
     successful_fetches = 0
-    with ThreadPoolExecutor(max_workers=10) as executor:
-        futures = [executor.submit(fetch_data, point) for point in grid_points]
-    
-    for i, point in enumerate(grid_points):
-        lat, lon = point["coordinates"]
-        print(f"\nFetching data for {point['name']} ({i+1}/{len(grid_points)}) - lat: {lat:.6f}, lon: {lon:.6f}")
-        
-        daily_data = fetch_data(lat, lon, days=7)
-        
-        if daily_data:
-            successful_fetches += 1
-            result_entry = {
-                "point_name": point["name"],
-                "geohash": point.get("geohash"),
-                "latitude": lat,
-                "longitude": lon,
-                "bbox": point.get("bbox"),
-                "weather_data": daily_data
-            }
-            all_results.append(result_entry)
-            
-            # Print summary for this point
-            print(f"  ✓ Success - {len(daily_data)} days fetched")
-            
-            # Optional: Print first day's data as sample
-            if daily_data:
-                sample = daily_data[0]
-                print(f"  Sample: {sample['date']} - Tmin: {sample['tmin']:.1f}°C, Tmax: {sample['tmax']:.1f}°C, Rain: {sample['rain']}mm")
+    db_errors = []
+
+    if args.to_db:
+        # Stream each fetched point to DB writer threads (no intermediate JSON file),
+        # each one COPYing on its own pooled connection
+        try:
+            conns = [getconn() for _ in range(COPY_WRITERS)]
+        except Exception as e:
+            print(f"❌ Database connection error: {e}")
+            exit(1)
+        record_queue = queue.Queue(maxsize=STREAM_QUEUE_SIZE)
+        writer_pool = ThreadPoolExecutor(max_workers=len(conns))
+        writers = [
+            writer_pool.submit(stream_ingest, conn, record_queue, with_grid=not args.no_grid)
+            for conn in conns
+        ]
+
+        def on_result(i, daily_data):
+            global successful_fetches
+            entry = build_result_entry(grid_points[i], i, len(grid_points), daily_data)
+            if entry:
+                successful_fetches += 1
+                record_queue.put(entry)
+
+        try:
+            if HAS_HTTPX:
+                print(f"Fetching {len(grid_points)} points (async, {ASYNC_CONCURRENCY} concurrent requests)")
+                asyncio.run(fetch_all_async(grid_points, days=7, on_result=on_result))
+            else:
+                with ThreadPoolExecutor(max_workers=10) as executor:
+                    futures = {
+                        executor.submit(fetch_data, p["coordinates"][0], p["coordinates"][1], 7): i
+                        for i, p in enumerate(grid_points)
+                    }
+                    for future in as_completed(futures):
+                        on_result(futures[future], future.result())
+        finally:
+            # One end-of-stream marker per writer
+            for _ in writers:
+                record_queue.put(None)
+            # Wait for every writer; a failed one hands back its error instead of a row count
+            db_errors = [writer.exception() for writer in writers]
+            writer_pool.shutdown()
+            for conn in conns:
+                putconn(conn)
+            closeall()
+        db_errors = [e for e in db_errors if e is not None]
+    else:
+        if HAS_HTTPX:
+            print(f"Fetching {len(grid_points)} points (async, {ASYNC_CONCURRENCY} concurrent requests)")
+            fetched = asyncio.run(fetch_all_async(grid_points, days=7))
         else:
-            print(f"  ✗ No data fetched")
+            fetched = [None] * len(grid_points)
+            with ThreadPoolExecutor(max_workers=10) as executor:
+                futures = {
+                    executor.submit(fetch_data, p["coordinates"][0], p["coordinates"][1], 7): i
+                    for i, p in enumerate(grid_points)
+                }
+                for future in as_completed(futures):
+                    fetched[futures[future]] = future.result()
+
+        for i, point in enumerate(grid_points):
+            entry = build_result_entry(point, i, len(grid_points), fetched[i])
+            if entry:
+                successful_fetches += 1
+                all_results.append(entry)
     
     # Save all results to a JSON file
-    output_file = "output/weather_data_all_grid_points.json"
-    save_results({
-        "metadata": {
-            "total_grid_points": len(grid_points),
-            "successful_fetches": successful_fetches,
-            "failed_fetches": len(grid_points) - successful_fetches,
-            "fetch_date": date.today().isoformat(),
-            "days_requested": 7,
-            "data_end_date": (date.today() - timedelta(days=3)).isoformat()
-        },
-        "results": all_results
-    }, output_file)
+    output_file = "PostgreSQL (climate_daily)" if args.to_db else "output/weather_data_all_grid_points.json"
+    if not args.to_db:
+        save_results({
+            "metadata": {
+                "total_grid_points": len(grid_points),
+                "successful_fetches": successful_fetches,
+                "failed_fetches": len(grid_points) - successful_fetches,
+                "fetch_date": date.today().isoformat(),
+                "days_requested": 7,
+                "data_end_date": DATA_END_DATE.isoformat()
+            },
+            "results": all_results
+        }, output_file)
     
     print(f"\n{'='*50}")
     print(f"SUMMARY:")
     print(f"Total grid points: {len(grid_points)}")
     print(f"Successful fetches: {successful_fetches}")
     print(f"Failed fetches: {len(grid_points) - successful_fetches}")
-    print(f"Results saved to: {output_file}")
-    print(f"{'='*50}")
\ No newline at end of file
+    if db_errors:
+        print(f"❌ Database writers failed ({len(db_errors)}/{COPY_WRITERS}): {db_errors[0]}")
+        print(f"   Some fetched points were NOT saved to {output_file}")
+    else:
+        print(f"Results saved to: {output_file}")
+    print(f"{'='*50}")
+    if db_errors:
+        sys.exit(1)
\ No newline at end of file
@@ -6,10 +6,13 @@ Usage: python ingest_climate.py [--json-file output/weather_data_all_grid_points
 """
 
 import os
+import io
+import csv
 import sys
-import json
+import orjson
+import numpy as np
 import argparse
-import psycopg2
+from concurrent.futures import ThreadPoolExecutor
 from psycopg2.extras import execute_values
 from datetime import datetime
 from dotenv import load_dotenv
@@ -19,17 +22,19 @@ load_dotenv()
 
 # Import local modules
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
-from compute_et0 import compute_et0
+from db import getconn, putconn, closeall
 
-# Database configuration
-DB_CONFIG = {
-   
-}
+# pysimdjson is optional: the lazy proxy tree is indexed directly, without building dicts
+try:
+    import simdjson
+    HAS_SIMDJSON = True
+except ImportError:
+    HAS_SIMDJSON = False
 
 def get_db_connection():
-    """Create database connection"""
+    """Borrow a database connection from the shared pool (give it back with putconn)"""
     try:
-        conn = psycopg2.connect(**DB_CONFIG)
+        conn = getconn()
         return conn
     except Exception as e:
         print(f"❌ Database connection error: {e}")
@@ -38,8 +43,9 @@ def get_db_connection():
 def load_json_data(json_path):
     """Load weather data from JSON file"""
     try:
-        with open(json_path, 'r') as f:
-            data = json.load(f)
+        with open(json_path, 'rb') as f:
+            raw = f.read()
+        data = simdjson.Parser().parse(raw) if HAS_SIMDJSON else orjson.loads(raw)
         print(f"✅ Loaded JSON data from {json_path}")
         return data
     except Exception as e:
@@ -56,24 +62,24 @@ def ingest_grid_points(conn, results):
         if geohash and result.get('latitude') and result.get('longitude'):
             # Garder seulement la première occurrence
             if geohash not in unique_grid:
-                # Create polygon from bbox if available
-                geom = None
+                # Grid cells are axis-aligned rectangles: send the bbox extent, built server-side
+                # with ST_MakeEnvelope (no WKT string to build or parse)
+                extent = (None, None, None, None)
                 bbox = result.get('bbox')
                 if bbox and len(bbox) > 0 and len(bbox[0]) >= 4:
-                    coords = bbox[0]
-                    if coords[0] != coords[-1]:
-                        coords.append(coords[0])
-                    coords_str = ', '.join([f"{c[0]} {c[1]}" for c in coords])
-                    geom = f"POLYGON(({coords_str}))"
+                    xs = [c[0] for c in bbox[0]]
+                    ys = [c[1] for c in bbox[0]]
+                    extent = (min(xs), min(ys), max(xs), max(ys))
                 
                 unique_grid[geohash] = (
                     geohash,
                     result['latitude'],
                     result['longitude'],
-                    geom
+                    *extent
                 )
     
-    grid_data = list(unique_grid.values())
+    # Sorted by geohash so concurrent writers lock grid_100m rows in the same order
+    grid_data = sorted(unique_grid.values())
     
     with conn.cursor() as cur:
         execute_values(cur, """
@@ -84,73 +90,99 @@ def ingest_grid_points(conn, results):
                 lon = EXCLUDED.lon,
                 geom = EXCLUDED.geom,
                 created_at = NOW()
-        """, grid_data)
+        """, grid_data,
+            template="(%s, %s, %s, ST_MakeEnvelope(%s, %s, %s, %s, 4326))",
+            page_size=1000)
         conn.commit()
     
     print(f"✅ Ingested {len(grid_data)} grid points")
     return len(grid_data)
 
+# et0 is a generated column (fao56_et0 in schema.sql), computed by PostgreSQL
+CLIMATE_DAILY_COLUMNS = "geohash, date, tmin, tmax, radiation, rain, rh, wind"
+
+# Weather variables stored as float64 columns, in CLIMATE_DAILY_COLUMNS order
+CLIMATE_VALUE_KEYS = ('tmin', 'tmax', 'radiation', 'rain', 'rh', 'wind')
+
+def climate_csv(geohashes, dates, values):
+    """
+    Render struct-of-arrays climate columns as CSV for COPY: geohashes/dates are
+    sequences of strings, values an (n, 6) float64 array where NaN means NULL
+    """
+    columns = values.astype(object)
+    columns[np.isnan(values)] = None  # None -> empty field -> NULL
+    buf = io.StringIO()
+    csv.writer(buf).writerows(zip(geohashes, dates, *columns.T.tolist()))
+    buf.seek(0)
+    return buf
+
+def copy_climate_daily(cur, geohashes, dates, values):
+    """
+    Bulk-load climate columns (see climate_csv) with COPY FROM STDIN into a
+    staging table, then move them into climate_daily (COPY itself cannot skip
+    existing (geohash, date) keys). Returns rows inserted.
+    """
+    buf = climate_csv(geohashes, dates, values)
+    
+    cur.execute("""
+        CREATE TEMP TABLE IF NOT EXISTS climate_daily_stage (
+            geohash TEXT,
+            date DATE,
+            tmin DOUBLE PRECISION,
+            tmax DOUBLE PRECISION,
+            radiation DOUBLE PRECISION,
+            rain DOUBLE PRECISION,
+            rh DOUBLE PRECISION,
+            wind DOUBLE PRECISION
+        ) ON COMMIT DELETE ROWS
+    """)
+    cur.copy_expert(
+        f"COPY climate_daily_stage ({CLIMATE_DAILY_COLUMNS}) FROM STDIN WITH (FORMAT csv, NULL '')",
+        buf
+    )
+    # Sorted by key so concurrent writers take climate_daily row locks in the same order
+    cur.execute(f"""
+        INSERT INTO climate_daily ({CLIMATE_DAILY_COLUMNS})
+        SELECT {CLIMATE_DAILY_COLUMNS} FROM climate_daily_stage
+        ORDER BY geohash, date
+        ON CONFLICT (geohash, date) DO NOTHING
+    """)
+    inserted = cur.rowcount
+    cur.execute("TRUNCATE climate_daily_stage")
+    return inserted
+
 def ingest_climate_daily(conn, results):
-    """Insert daily climate data with ET0 calculation"""
-    daily_data = []
+    """Insert daily climate data (ET0 is computed by the database)"""
+    # Colonnes (struct-of-arrays) pré-allouées pour le nombre maximal de jours
+    n_max = sum(len(result.get('weather_data', [])) for result in results)
+    geohashes = []
+    dates = []
+    values = np.empty((n_max, len(CLIMATE_VALUE_KEYS)), dtype=np.float64)
+    seen = set()
+    n = 0
     
     for result in results:
         geohash = result.get('geohash')
         weather_data = result.get('weather_data', [])
         
-        # Pour chaque jour, ajouter aux données
+        # Pour chaque jour, ajouter aux colonnes
         for day in weather_data:
-            # Calculer ET0
-            et0 = compute_et0(
-                day.get('tmin'),
-                day.get('tmax'),
-                day.get('radiation'),
-                day.get('rh'),
-                day.get('wind')
-            )
-            
-            daily_data.append((
-                geohash,
-                day['date'],
-                day.get('tmin'),
-                day.get('tmax'),
-                day.get('radiation'),
-                day.get('rain'),
-                day.get('rh'),
-                day.get('wind'),
-                et0
-            ))
-    
-    if daily_data:
-        # 🔥 ÉTAPE 1: Supprimer les doublons dans daily_data (même geohash + même date)
-        unique_data = {}
-        for record in daily_data:
-            key = (record[0], record[1])  # (geohash, date)
-            if key not in unique_data:
-                unique_data[key] = record
-        
-        daily_data_unique = list(unique_data.values())
-        
-        print(f"   Filtrage: {len(daily_data)} → {len(daily_data_unique)} enregistrements uniques")
+            # 🔥 ÉTAPE 1: Ignorer les doublons à la volée (même geohash + même date)
+            key = (geohash, day['date'])
+            if key in seen:
+                continue
+            seen.add(key)
+            geohashes.append(geohash)
+            dates.append(day['date'])
+            values[n] = [day.get(k) for k in CLIMATE_VALUE_KEYS]  # None -> NaN
+            n += 1
+    
+    if n:
+        print(f"   Filtrage: {n_max} → {n} enregistrements uniques")
         
         with conn.cursor() as cur:
-            # 🔥 ÉTAPE 2: Diviser en lots pour éviter les problèmes
-            batch_size = 500
-            total_inserted = 0
-            
-            for i in range(0, len(daily_data_unique), batch_size):
-                batch = daily_data_unique[i:i + batch_size]
-                
-                # Utiliser ON CONFLICT DO NOTHING pour ignorer les doublons existants
-                execute_values(cur, """
-                    INSERT INTO climate_daily 
-                    (geohash, date, tmin, tmax, radiation, rain, rh, wind, et0)
-                    VALUES %s
-                    ON CONFLICT (geohash, date) DO NOTHING
-                """, batch)
-                
-                total_inserted += len(batch)
-            
+            # 🔥 ÉTAPE 2: COPY vers une table temporaire puis INSERT ... ON CONFLICT
+            total_inserted = copy_climate_daily(cur, geohashes, dates, values[:n])
             conn.commit()
         
         print(f"✅ Ingested {total_inserted} daily records")
@@ -158,6 +190,83 @@ def ingest_climate_daily(conn, results):
     
     return 0
 
+# Daily rows per COPY batch, and concurrent COPY streams (one pooled connection each)
+COPY_BATCH_ROWS = 10000
+COPY_WRITERS = 4
+
+def stream_ingest(conn, record_queue, batch_size=COPY_BATCH_ROWS, with_grid=True):
+    """
+    DB writer loop: drain fetched point results from record_queue (None ends the
+    stream) and ingest them in batches of ~batch_size daily rows, so memory stays
+    O(batch) instead of O(grid). Returns the number of daily rows inserted.
+    After a failed batch the queue is still drained, then the error is raised.
+    """
+    total_inserted = 0
+    batch = []
+    batch_rows = 0
+    error = None
+    
+    while True:
+        result = record_queue.get()
+        if result is not None:
+            batch.append(result)
+            batch_rows += len(result.get('weather_data', []))
+        
+        if batch and (result is None or batch_rows >= batch_size):
+            # Après une erreur on continue de vider la file pour ne pas bloquer le fetch
+            if error is None:
+                try:
+                    if with_grid:
+                        ingest_grid_points(conn, batch)
+                    total_inserted += ingest_climate_daily(conn, batch)
+                except Exception as e:
+                    print(f"❌ Error: {e}")
+                    conn.rollback()
+                    error = e
+            batch = []
+            batch_rows = 0
+        
+        if result is None:
+            if error is not None:
+                raise error
+            print(f"✅ Streamed {total_inserted} daily records into climate_daily")
+            return total_inserted
+
+def _ingest_chunk(chunk):
+    """Worker: ingest one chunk of results on its own pooled connection"""
+    conn = getconn()
+    try:
+        return ingest_climate_daily(conn, chunk)
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        putconn(conn)
+
+def ingest_climate_parallel(results, workers=COPY_WRITERS, batch_size=COPY_BATCH_ROWS):
+    """
+    Split results into chunks of ~batch_size daily rows and COPY them through
+    `workers` concurrent connections. Returns the number of daily rows inserted.
+    """
+    chunks = []
+    chunk = []
+    chunk_rows = 0
+    for result in results:
+        chunk.append(result)
+        chunk_rows += len(result.get('weather_data', []))
+        if chunk_rows >= batch_size:
+            chunks.append(chunk)
+            chunk = []
+            chunk_rows = 0
+    if chunk:
+        chunks.append(chunk)
+    
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        total_inserted = sum(executor.map(_ingest_chunk, chunks))
+    
+    print(f"✅ Ingested {total_inserted} daily records ({len(chunks)} COPY batches, {workers} streams)")
+    return total_inserted
+
 def main():
     parser = argparse.ArgumentParser(description='Ingest climate data into database')
     parser.add_argument('--json-file', type=str, 
@@ -190,8 +299,8 @@ def main():
         if not args.no_grid:
             ingest_grid_points(conn, results)
         
-        # Ingest daily climate data
-        ingest_climate_daily(conn, results)
+        # Ingest daily climate data (parallel COPY streams)
+        ingest_climate_parallel(results)
         
         print("\n" + "="*60)
         print("✅ INGESTION COMPLETED SUCCESSFULLY")
@@ -201,7 +310,8 @@ def main():
         print(f"❌ Error: {e}")
         conn.rollback()
     finally:
-        conn.close()
+        putconn(conn)
+        closeall()
 
 if __name__ == "__main__":
     main()
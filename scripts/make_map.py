@@ -7,22 +7,34 @@ Usage: python make_map.py [--date YYYY-MM-DD] [--param et0]
 
 import os
 import sys
-import json
+import orjson
+import io
+import shutil
+import string
+import hashlib
 import argparse
 import folium
 from folium import plugins
 import psycopg2
-from psycopg2.extras import DictCursor
-from datetime import date, timedelta, datetime
+from datetime import date, timedelta
 from dotenv import load_dotenv
 import branca.colormap as cm
+from jinja2 import Template
+import numpy as np
 import math
 
-load_dotenv()
+# Numba is optional: the per-cell geometry/color kernels are JIT-compiled when available
+try:
+    from numba import njit
+    HAS_NUMBA = True
+except ImportError:
+    HAS_NUMBA = False
 
-DB_CONFIG = {
+load_dotenv()
 
-}
+# Import local modules
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from db import DB_CONFIG
 
 # Color schemes for different parameters
 COLOR_SCHEMES = {
@@ -73,213 +85,339 @@ COLOR_SCHEMES = {
 def get_db_connection():
     """Create database connection"""
     try:
-        conn = psycopg2.connect(**DB_CONFIG, cursor_factory=DictCursor)
+        conn = psycopg2.connect(**DB_CONFIG)
         return conn
     except Exception as e:
         print(f"❌ Database connection error: {e}")
         return None
 
-def get_available_dates(conn):
-    """Get all available dates from climate_daily"""
+# Covering indexes for CLIMATE_MAP_SQL, created by schema.sql (only checked here)
+MAP_INDEXES = {
+    'ix_cd_date_et0':
+        "CREATE INDEX IF NOT EXISTS ix_cd_date_et0 ON climate_daily (date) "
+        "INCLUDE (geohash, tmin, tmax, rain, rh, wind, et0) WHERE et0 IS NOT NULL;",
+    'ix_grid_geohash':
+        "CREATE INDEX IF NOT EXISTS ix_grid_geohash ON grid_100m (geohash) INCLUDE (lat, lon, geom);",
+}
+
+def check_map_indexes(conn):
+    """Vérifie la présence des index couvrants utilisés par la requête de la carte"""
     with conn.cursor() as cur:
-        cur.execute("SELECT DISTINCT date FROM climate_daily WHERE et0 IS NOT NULL ORDER BY date")
-        return [row[0] for row in cur.fetchall()]
+        cur.execute("SELECT indexname FROM pg_indexes WHERE indexname = ANY(%s)", (list(MAP_INDEXES),))
+        existing = {row[0] for row in cur.fetchall()}
+    
+    missing = [name for name in MAP_INDEXES if name not in existing]
+    for name in missing:
+        print(f"⚠️ Index manquant: {name}")
+        print(f"   👉 {MAP_INDEXES[name]}")
+    return not missing
 
-def get_climate_data_from_db(conn, target_date=None):
-    """Get climate data for mapping from climate_daily table - VERSION CORRIGÉE"""
-    
+def get_date_counts(conn):
+    """Get (date, record count) for every date with data in climate_daily, in one query"""
     with conn.cursor() as cur:
-        # Étape 1: Récupérer toutes les dates qui ont des données NON NULLES pour et0
         cur.execute("""
-            SELECT DISTINCT date 
-            FROM climate_daily 
-            WHERE et0 IS NOT NULL 
+            SELECT date, COUNT(*)
+            FROM climate_daily
+            WHERE et0 IS NOT NULL
+            GROUP BY date
             ORDER BY date
         """)
-        available_dates = [row[0] for row in cur.fetchall()]
-        
-        if not available_dates:
-            print("❌ Aucune date avec des données valides trouvée dans climate_daily")
-            return []
-        
-        print(f"📅 Dates avec données valides: {available_dates[0]} → {available_dates[-1]}")
-        
-        # Étape 2: Déterminer la date à utiliser
-        if target_date is None:
-            target_date = available_dates[-1]
-            print(f"📅 Utilisation de la dernière date avec données: {target_date}")
-        elif target_date not in available_dates:
-            print(f"⚠️ Date {target_date} non disponible ou sans données")
-            print(f"📅 Utilisation de {available_dates[-1]} à la place")
-            target_date = available_dates[-1]
-        
-        # Étape 3: Récupérer les données pour cette date
-        cur.execute("""
-            SELECT 
-                g.geohash,
-                g.lat,
-                g.lon,
-                ST_AsGeoJSON(g.geom) as geom,
-                d.date,
-                d.tmin,
-                d.tmax,
-                d.rain,
-                d.rh,
-                d.wind,
-                d.et0
-            FROM climate_daily d
-            JOIN grid_100m g ON d.geohash = g.geohash
-            WHERE d.date = %s AND d.et0 IS NOT NULL
-            ORDER BY g.geohash
-        """, (target_date,))
+        return cur.fetchall()
+
+# Cells and climate values for one date, columns in MAP_COLUMNS order (the date itself is
+# not selected per row: every row shares it, it is stored once as climate_data['date'])
+MAP_COLUMNS = ('geohash', 'lat', 'lon', 'geom', 'tmin', 'tmax', 'rain', 'rh', 'wind', 'et0',
+               'center_lat', 'center_lon')
+CLIMATE_MAP_SQL = """
+    SELECT 
+        g.geohash,
+        g.lat,
+        g.lon,
+        -- Cell square built server-side (grid polygon, or 100 m envelope around the center)
+        ST_AsGeoJSON(COALESCE(g.geom, ST_MakeEnvelope(
+            g.lon - 50 / (111111.0 * cos(radians(g.lat))), g.lat - 50 / 111111.0,
+            g.lon + 50 / (111111.0 * cos(radians(g.lat))), g.lat + 50 / 111111.0,
+            4326))) as geom,
+        d.tmin,
+        d.tmax,
+        d.rain,
+        d.rh,
+        d.wind,
+        d.et0,
+        -- Map center computed by the database (same value on every row)
+        AVG(g.lat) OVER () AS center_lat,
+        AVG(g.lon) OVER () AS center_lon
+    FROM climate_daily d
+    JOIN grid_100m g ON d.geohash = g.geohash
+    WHERE d.date = %s AND d.et0 IS NOT NULL
+    ORDER BY g.geohash
+"""
+
+STREAM_ITERSIZE = 10000  # rows per server-side cursor round-trip
+
+def rows_to_columns(rows, names):
+    """Transpose tuple rows (AoS) into a {name: column} dict (SoA); lat/lon become float64 arrays"""
+    if not rows:
+        return {}
+    columns = dict(zip(names, zip(*rows)))
+    for name in ('lat', 'lon'):
+        columns[name] = np.asarray(columns[name], dtype=np.float64)
+    return columns
+
+def fetch_map_columns(conn, target_date):
+    """
+    Run CLIMATE_MAP_SQL through a named (server-side) cursor so only
+    STREAM_ITERSIZE rows sit in the client buffer at a time, instead of the
+    whole result set plus its fetchall() copy. Plain tuple rows are transposed
+    into columns (see rows_to_columns).
+    Returns (columns, et0 min, et0 max, et0 sum) with the stats accumulated on the fly.
+    """
+    rows = []
+    i_et0 = MAP_COLUMNS.index('et0')
+    et0_min, et0_max, et0_sum = math.inf, -math.inf, 0.0
+    with conn.cursor(name='climate_stream') as cur:
+        cur.itersize = STREAM_ITERSIZE
+        cur.execute(CLIMATE_MAP_SQL, (target_date,))
+        for row in cur:
+            rows.append(row)
+            et0 = row[i_et0]
+            et0_min = min(et0_min, et0)
+            et0_max = max(et0_max, et0)
+            et0_sum += et0
+    return rows_to_columns(rows, MAP_COLUMNS), et0_min, et0_max, et0_sum
+
+def get_climate_data_from_db(conn, target_date=None):
+    """Get climate data for mapping from climate_daily table as {column: values} - VERSION CORRIGÉE"""
+    
+    with conn.cursor() as cur:
+        # Étape 1: Date demandée -> requête directe, sans scanner toutes les dates
+        columns = {}
+        if target_date is not None:
+            columns, et0_min, et0_max, et0_sum = fetch_map_columns(conn, target_date)
         
-        results = cur.fetchall()
+        # Étape 2: Sinon (ou si elle est vide), utiliser la dernière date avec données NON NULLES pour et0
+        if not columns:
+            cur.execute("SELECT MIN(date), MAX(date) FROM climate_daily WHERE et0 IS NOT NULL")
+            first_date, last_date = cur.fetchone()
+            
+            if last_date is None:
+                print("❌ Aucune date avec des données valides trouvée dans climate_daily")
+                return {}
+            
+            print(f"📅 Dates avec données valides: {first_date} → {last_date}")
+            
+            if target_date is None:
+                print(f"📅 Utilisation de la dernière date avec données: {last_date}")
+            else:
+                print(f"⚠️ Date {target_date} non disponible ou sans données")
+                print(f"📅 Utilisation de {last_date} à la place")
+            
+            # Étape 3: Récupérer les données pour cette date (déjà vide si c'était la date demandée)
+            if last_date != target_date:
+                target_date = last_date
+                columns, et0_min, et0_max, et0_sum = fetch_map_columns(conn, target_date)
         
-        if results:
-            print(f"✅ {len(results)} points avec données trouvés pour le {target_date}")
+        if columns:
+            columns['date'] = target_date
+            n_points = len(columns['geohash'])
+            print(f"✅ {n_points} points avec données trouvés pour le {target_date}")
             
             # Vérifier les valeurs du premier point
-            first = results[0]
             print(f"\n🔍 Premier point avec données:")
-            print(f"   geohash: {first['geohash']}")
-            print(f"   date: {first['date']}")
-            print(f"   tmin: {first['tmin']}°C")
-            print(f"   tmax: {first['tmax']}°C")
-            print(f"   et0: {first['et0']} mm")
-            print(f"   rain: {first['rain']} mm")
+            print(f"   geohash: {columns['geohash'][0]}")
+            print(f"   date: {columns['date']}")
+            print(f"   tmin: {columns['tmin'][0]}°C")
+            print(f"   tmax: {columns['tmax'][0]}°C")
+            print(f"   et0: {columns['et0'][0]} mm")
+            print(f"   rain: {columns['rain'][0]} mm")
             
-            # Statistiques rapides
-            et0_values = [r['et0'] for r in results if r['et0'] is not None]
-            if et0_values:
-                print(f"\n📊 Statistiques ET0 pour cette date:")
-                print(f"   Min: {min(et0_values):.2f} mm")
-                print(f"   Max: {max(et0_values):.2f} mm")
-                print(f"   Moyenne: {sum(et0_values)/len(et0_values):.2f} mm")
+            # Statistiques rapides (et0 IS NOT NULL dans la requête, cumulées pendant le streaming)
+            print(f"\n📊 Statistiques ET0 pour cette date:")
+            print(f"   Min: {et0_min:.2f} mm")
+            print(f"   Max: {et0_max:.2f} mm")
+            print(f"   Moyenne: {et0_sum/n_points:.2f} mm")
         else:
             print(f"⚠️ Aucun point avec données pour le {target_date}")
         
-        return results
+        return columns
+
+def _json_row(result, day):
+    """Map row (MAP_COLUMNS without the center columns) for one JSON point/day"""
+    return (
+        str(result.get('geohash', '')),  # null geohash rendered as 'None', never None
+        float(result.get('latitude', 0)),
+        float(result.get('longitude', 0)),
+        None,  # geom: squares are built from lat/lon
+        day.get('tmin'),
+        day.get('tmax'),
+        day.get('rain'),
+        day.get('rh'),
+        day.get('wind'),
+        day.get('et0')
+    )
 
 def get_climate_data_from_json(json_path, target_date=None):
-    """Get climate data from JSON file"""
+    """Get climate data from JSON file as {column: values} (same layout as the database path)"""
     try:
-        with open(json_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        with open(json_path, 'rb') as f:
+            data = orjson.loads(f.read())
         
-        # Obtenir toutes les dates disponibles dans le JSON
+        target_str = target_date.strftime('%Y%m%d') if target_date else None
+        
+        # Un seul passage: dates disponibles, lignes de la date demandée et lignes de la
+        # dernière date vue (repli si la date demandée est absente)
         all_dates = set()
+        requested_rows = []
+        latest_date, latest_rows = None, []
         for result in data.get('results', []):
-            for day in result.get('weather_data', []):
-                if day.get('date') and day.get('et0') is not None:
-                    all_dates.add(day['date'])
+            got_requested = got_latest = False
+            for day in result.get('weather_data') or []:
+                day_str = day.get('date')
+                if not day_str or day.get('et0') is None:
+                    continue
+                all_dates.add(day_str)
+                # Premier jour correspondant à la date cible pour ce point
+                if day_str == target_str and not got_requested:
+                    requested_rows.append(_json_row(result, day))
+                    got_requested = True
+                if latest_date is None or day_str > latest_date:
+                    latest_date, latest_rows = day_str, [_json_row(result, day)]
+                    got_latest = True
+                elif day_str == latest_date and not got_latest:
+                    latest_rows.append(_json_row(result, day))
+                    got_latest = True
         
-        available_dates = sorted(list(all_dates))
-        if not available_dates:
+        if not all_dates:
             print("❌ Aucune date avec données valides dans le JSON")
-            return []
+            return {}
             
-        print(f"📅 Dates disponibles dans JSON: {available_dates[0]} → {available_dates[-1]}")
+        print(f"📅 Dates disponibles dans JSON: {min(all_dates)} → {latest_date}")
         
         # Déterminer la date cible
-        target_str = None
-        if target_date:
-            target_str = target_date.strftime('%Y%m%d')
-            if target_str not in available_dates:
-                print(f"⚠️ Date {target_str} non disponible dans JSON")
-                target_str = available_dates[-1]
-                print(f"📅 Utilisation de la dernière date: {target_str}")
+        if target_str in all_dates:
+            rows = requested_rows
         else:
-            target_str = available_dates[-1]
+            if target_str:
+                print(f"⚠️ Date {target_str} non disponible dans JSON")
+                print(f"📅 Utilisation de la dernière date: {latest_date}")
+            target_str, rows = latest_date, latest_rows
         
         print(f"📅 Chargement des données pour le {target_str}")
-        
-        climate_data = []
-        for result in data.get('results', []):
-            if result.get('weather_data'):
-                weather_data = result.get('weather_data', [])
-                # Chercher le jour correspondant à la date cible
-                selected_day = next((d for d in weather_data if d.get('date') == target_str and d.get('et0') is not None), None)
-                
-                if selected_day:
-                    climate_data.append({
-                        'geohash': result.get('geohash', ''),
-                        'lat': float(result.get('latitude', 0)),
-                        'lon': float(result.get('longitude', 0)),
-                        'geom': None,
-                        'date': selected_day.get('date'),
-                        'tmin': selected_day.get('tmin'),
-                        'tmax': selected_day.get('tmax'),
-                        'rain': selected_day.get('rain'),
-                        'rh': selected_day.get('rh'),
-                        'wind': selected_day.get('wind'),
-                        'et0': selected_day.get('et0')
-                    })
-        
-        print(f"✅ {len(climate_data)} points chargés depuis le JSON")
-        return climate_data
+        print(f"✅ {len(rows)} points chargés depuis le JSON")
+        # No center columns: create_map averages lat/lon itself
+        columns = rows_to_columns(rows, MAP_COLUMNS[:-2])
+        if columns:
+            columns['date'] = target_str
+        return columns
         
     except Exception as e:
         print(f"❌ Erreur lors du chargement du JSON: {e}")
-        return []
+        return {}
 
-def get_color(value, param='et0'):
-    """Get color based on parameter value"""
+NO_DATA_COLOR = '#808080'  # Gray for no data
+
+# -----------------------------
+# Numeric kernels (plain floats / NumPy arrays, njit-compiled when numba is installed)
+# -----------------------------
+def _square_corners(lat, lon, size_m):
+    """Closed (5, 2) [lon, lat] ring of the size_m square centered on (lat, lon)"""
+    lat_offset = size_m / 2 / 111111.0
+    lon_offset = size_m / 2 / (111111.0 * math.cos(math.radians(lat)))
+    ring = np.empty((5, 2))
+    ring[0, 0], ring[0, 1] = lon - lon_offset, lat - lat_offset
+    ring[1, 0], ring[1, 1] = lon + lon_offset, lat - lat_offset
+    ring[2, 0], ring[2, 1] = lon + lon_offset, lat + lat_offset
+    ring[3, 0], ring[3, 1] = lon - lon_offset, lat + lat_offset
+    ring[4, 0], ring[4, 1] = lon - lon_offset, lat - lat_offset
+    return ring
+
+def _color_index(value, vmin, vmax, n):
+    """Palette index of value among n colors; n (the no-data slot) for NaN"""
+    if math.isnan(value):
+        return n
+    if vmax == vmin:
+        normalized = 0.5
+    else:
+        normalized = max(0.0, min(1.0, (value - vmin) / (vmax - vmin)))
+    return int(normalized * (n - 1))
+
+def _square_rings(lats, lons, size_m):
+    """(N, 5, 2) rings for float64 center arrays"""
+    rings = np.empty((lats.shape[0], 5, 2))
+    for i in range(lats.shape[0]):
+        rings[i] = _square_corners(lats[i], lons[i], size_m)
+    return rings
+
+def _color_indices(vals, vmin, vmax, n):
+    """Palette indices for a float64 value array (NaN -> n)"""
+    index = np.empty(vals.shape[0], dtype=np.int64)
+    for i in range(vals.shape[0]):
+        index[i] = _color_index(vals[i], vmin, vmax, n)
+    return index
+
+if HAS_NUMBA:
+    # cache=True: compiled once, then reloaded from __pycache__ on later runs
+    _square_corners = njit(cache=True)(_square_corners)
+    _color_index = njit(cache=True)(_color_index)
+    _square_rings = njit(cache=True)(_square_rings)
+    _color_indices = njit(cache=True)(_color_indices)
+
+def get_palette(param='et0'):
+    """Palette of a parameter, with the no-data color in the last slot"""
     scheme = COLOR_SCHEMES.get(param, COLOR_SCHEMES['et0'])
+    return scheme['colors'] + [NO_DATA_COLOR]
+
+def get_color_indices(values, param='et0'):
+    """Get uint8 palette indices (see get_palette) for a whole sequence of values"""
+    scheme = COLOR_SCHEMES.get(param, COLOR_SCHEMES['et0'])
+    colors = scheme['colors']
+    vals = np.array([np.nan if v is None else v for v in values], dtype=np.float64)
+    missing = np.isnan(vals)
     
-    if value is None:
-        return '#808080'  # Gray for no data
-    
-    # Normalize value
+    # Normalize values
     vmin = scheme['min']
     vmax = scheme['max']
     
+    if HAS_NUMBA:
+        return _color_indices(vals, float(vmin), float(vmax), len(colors)).astype(np.uint8)
+    
     if vmax == vmin:
-        normalized = 0.5
+        normalized = np.full(vals.shape, 0.5)
     else:
-        normalized = max(0, min(1, (value - vmin) / (vmax - vmin)))
+        normalized = np.clip((np.where(missing, vmin, vals) - vmin) / (vmax - vmin), 0, 1)
     
-    colors = scheme['colors']
-    index = int(normalized * (len(colors) - 1))
-    return colors[index]
+    index = (normalized * (len(colors) - 1)).astype(np.uint8)
+    index[missing] = len(colors)  # last palette slot is the no-data color
+    return index
 
-def create_square_grid(center_lat, center_lon, size_m=100):
-    """Create a square polygon around center point"""
+def create_square_grids(lats, lons, size_m=100):
+    """
+    Create square polygon rings around all center points at once.
+    Returns an (N, 5, 2) array of closed [lon, lat] rings.
+    """
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+    if HAS_NUMBA:
+        return _square_rings(lats, lons, float(size_m))
+    
     lat_offset = size_m / 2 / 111111.0
-    lon_offset = size_m / 2 / (111111.0 * math.cos(math.radians(center_lat)))
-    
-    coords = [
-        [center_lon - lon_offset, center_lat - lat_offset],
-        [center_lon + lon_offset, center_lat - lat_offset],
-        [center_lon + lon_offset, center_lat + lat_offset],
-        [center_lon - lon_offset, center_lat + lat_offset],
-        [center_lon - lon_offset, center_lat - lat_offset]
-    ]
-    
-    return {
-        "type": "Polygon",
-        "coordinates": [coords]
-    }
+    lon_offset = size_m / 2 / (111111.0 * np.cos(np.radians(lats)))
+    
+    west, east = lons - lon_offset, lons + lon_offset
+    south, north = lats - lat_offset, lats + lat_offset
+    return np.stack([
+        np.stack([west, south], axis=-1),
+        np.stack([east, south], axis=-1),
+        np.stack([east, north], axis=-1),
+        np.stack([west, north], axis=-1),
+        np.stack([west, south], axis=-1)
+    ], axis=1)
 
-def create_popup_content(row):
-    """Create HTML popup content"""
-    # Format date
-    if isinstance(row['date'], date):
-        date_str = row['date'].strftime('%Y-%m-%d')
-    else:
-        date_str = str(row['date'])
-    
-    # Format values with proper handling of None
-    tmin_val = f"{row['tmin']:.1f}°C" if row['tmin'] is not None else 'N/A'
-    tmax_val = f"{row['tmax']:.1f}°C" if row['tmax'] is not None else 'N/A'
-    et0_val = f"{row['et0']:.2f} mm" if row['et0'] is not None else 'N/A'
-    rain_val = f"{row['rain']:.1f} mm" if row['rain'] is not None else 'N/A'
-    rh_val = f"{row['rh']:.0f}%" if row['rh'] is not None else 'N/A'
-    wind_val = f"{row['wind']:.1f} m/s" if row['wind'] is not None else 'N/A'
-    
-    html = f"""
+# Popup HTML, parsed once into emit_features (see _build_feature_emitter)
+POPUP_TEMPLATE = """
     <div style="font-family: Arial; min-width: 240px; padding: 10px; background-color: white; border-radius: 5px;">
         <h4 style="margin:0 0 10px 0; color:#2c3e50; border-bottom: 2px solid #3498db; padding-bottom: 5px;">
-            🧩 Grid Cell: {row['geohash']}
+            🧩 Grid Cell: {geohash}
         </h4>
         <table style="width:100%; border-collapse: collapse;">
             <tr style="background-color: #f8f9fa;">
@@ -288,46 +426,168 @@ def create_popup_content(row):
             </tr>
             <tr>
                 <td style="padding: 5px;"><strong>🌡️ Tmin:</strong></td>
-                <td style="padding: 5px; text-align:right; color: #2980b9;">{tmin_val}</td>
+                <td style="padding: 5px; text-align:right; color: #2980b9;">{tmin}</td>
             </tr>
             <tr style="background-color: #f8f9fa;">
                 <td style="padding: 5px;"><strong>🌡️ Tmax:</strong></td>
-                <td style="padding: 5px; text-align:right; color: #c0392b;">{tmax_val}</td>
+                <td style="padding: 5px; text-align:right; color: #c0392b;">{tmax}</td>
             </tr>
             <tr>
                 <td style="padding: 5px;"><strong>💧 ET0:</strong></td>
-                <td style="padding: 5px; text-align:right; color: #27ae60; font-weight: bold;">{et0_val}</td>
+                <td style="padding: 5px; text-align:right; color: #27ae60; font-weight: bold;">{et0}</td>
             </tr>
             <tr style="background-color: #f8f9fa;">
                 <td style="padding: 5px;"><strong>☔ Rain:</strong></td>
-                <td style="padding: 5px; text-align:right; color: #3498db;">{rain_val}</td>
+                <td style="padding: 5px; text-align:right; color: #3498db;">{rain}</td>
             </tr>
             <tr>
                 <td style="padding: 5px;"><strong>💨 RH:</strong></td>
-                <td style="padding: 5px; text-align:right; color: #8e44ad;">{rh_val}</td>
+                <td style="padding: 5px; text-align:right; color: #8e44ad;">{rh}</td>
             </tr>
             <tr style="background-color: #f8f9fa;">
                 <td style="padding: 5px;"><strong>🌀 Wind:</strong></td>
-                <td style="padding: 5px; text-align:right; color: #7f8c8d;">{wind_val}</td>
+                <td style="padding: 5px; text-align:right; color: #7f8c8d;">{wind}</td>
             </tr>
         </table>
         <p style="margin:10px 0 0 0; font-size:0.8em; color:#7f8c8d; text-align:center; border-top: 1px solid #ecf0f1; padding-top: 5px;">
             Click for more details
         </p>
     </div>
+"""
+
+def format_date(value):
+    """Format the dataset date (date object from the DB, YYYYMMDD string from the JSON)"""
+    if isinstance(value, date):
+        return value.strftime('%Y-%m-%d')
+    return str(value)
+
+# Popup values: column -> (format spec, suffix)
+POPUP_FORMATS = {
+    'tmin': ('.1f', '°C'),
+    'tmax': ('.1f', '°C'),
+    'et0': ('.2f', ' mm'),
+    'rain': ('.1f', ' mm'),
+    'rh': ('.0f', '%'),
+    'wind': ('.1f', ' m/s'),
+}
+# Columns shown in the popup, in emit_features column argument order
+POPUP_COLUMNS = ('geohash',) + tuple(POPUP_FORMATS)
+
+# -----------------------------
+# Specialized GeoJSON emitter (generated once at import)
+# -----------------------------
+def _build_feature_emitter():
+    """
+    Generate emit_features(out, date_str, suffix, geoms, values, color_indices,
+    geohash, tmin, ..., wind) with POPUP_TEMPLATE and POPUP_FORMATS inlined:
+    each cell is written to `out` as one bytes %-format, without building a
+    feature dict or re-parsing the popup template. geoms are GeoJSON bytes.
+    """
+    namespace = {'_dumps': orjson.dumps}
+    params = ['c%d' % i for i in range(len(POPUP_COLUMNS))]
+    column_var = dict(zip(POPUP_COLUMNS, params))
+    pieces = []
+    for i, (literal, field, _spec, _conv) in enumerate(string.Formatter().parse(POPUP_TEMPLATE)):
+        if literal:
+            namespace[f'_L{i}'] = literal
+            pieces.append(f'_L{i}')
+        if field == 'date_str':
+            pieces.append('date_str')
+        elif field == 'geohash':
+            pieces.append(column_var['geohash'])
+        elif field:
+            spec, suffix = POPUP_FORMATS[field]
+            var = column_var[field]
+            pieces.append(f"('N/A' if {var} is None else format({var}, {spec!r}) + {suffix!r})")
+    src = (
+        f"def emit_features(out, date_str, suffix, geoms, values, color_indices, {', '.join(params)}):\n"
+        f"    sep = b''\n"
+        f"    for geom, value, ci, {', '.join(params)} in zip(geoms, values, color_indices, {', '.join(params)}):\n"
+        f"        popup = {' + '.join(pieces)}\n"
+        f"        tooltip = c0 if value is None else c0 + ': ' + format(value, '.2f') + suffix\n"
+        f"        out.write(sep + b'{{\"type\":\"Feature\",\"geometry\":%b,\"properties\":{{\"ci\":%d,\"geohash\":%b,'\n"
+        f"            b'\"value\":%b,\"popup_html\":%b,\"tooltip\":%b}}}}'\n"
+        f"            % (geom, ci, _dumps(c0), _dumps(value), _dumps(popup), _dumps(tooltip)))\n"
+        f"        sep = b','\n"
+    )
+    exec(src, namespace)
+    return namespace['emit_features']
+
+emit_features = _build_feature_emitter()
+
+# Cell styles, declared once (fillColor comes from the palette)
+CELL_STYLE = {'color': 'black', 'weight': 0.5, 'fillOpacity': 0.2}
+HIGHLIGHT_STYLE = {'weight': 2, 'color': 'black', 'fillOpacity': 0.5}
+
+class GridLayer(folium.map.Layer):
+    """
+    Whole grid as one raw Leaflet L.geoJson layer rendered by a single template:
+    styles, popups, tooltips and highlighting are read from each feature's
+    properties in the browser instead of being templated per cell by Folium.
+    Cell colors travel as palette indices (properties.ci) into a palette declared once;
+    one style object per palette entry and a single highlight object are shared by
+    every cell, so no style function or style dict is created per cell.
+    With data_url the FeatureCollection is not inlined but fetched from that
+    (relative) URL, which needs the map to be served over HTTP.
     """
-    return html
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+            var {{ this.get_name() }}_styles = {{ this.palette|tojson }}.map(function(color) {
+                return Object.assign({fillColor: color}, {{ this.cell_style|tojson }});
+            });
+            var {{ this.get_name() }}_highlight = {{ this.highlight_style|tojson }};
+            var {{ this.get_name() }} = L.geoJson(null, {
+                // One <canvas> for every cell instead of one SVG node per square
+                renderer: L.canvas({padding: 0.5}),
+                style: function(feature) {
+                    return {{ this.get_name() }}_styles[feature.properties.ci];
+                },
+                onEachFeature: function(feature, layer) {
+                    layer.bindPopup(feature.properties.popup_html, {maxWidth: 300});
+                    layer.bindTooltip(feature.properties.tooltip, {sticky: true});
+                    layer.on({
+                        mouseover: function(e) { e.target.setStyle({{ this.get_name() }}_highlight); },
+                        mouseout: function(e) { {{ this.get_name() }}.resetStyle(e.target); }
+                    });
+                }
+            }).addTo({{ this._parent.get_name() }});
+            {% if this.data_url %}
+            fetch({{ this.data_url|tojson }})
+                .then(function(response) { return response.json(); })
+                .then(function(data) { {{ this.get_name() }}.addData(data); });
+            {% else %}
+            {{ this.get_name() }}.addData({{ this.data_json }});
+            {% endif %}
+        {% endmacro %}
+    """)
+
+    def __init__(self, data_json, palette, name=None, data_url=None):
+        super().__init__(name=name)
+        self._name = 'GridLayer'
+        # Pre-serialized FeatureCollection; '</' escaped so it cannot close the <script>
+        self.data_json = data_json.replace('</', '<\\/') if data_json else None
+        self.palette = palette
+        self.cell_style = CELL_STYLE
+        self.highlight_style = HIGHLIGHT_STYLE
+        self.data_url = data_url
 
-def create_map(climate_data, param='et0', output_file='output/climate_map.html'):
-    """Create interactive Folium map with square grids"""
+def create_map(climate_data, param='et0', output_file='output/climate_map.html', external_data=False):
+    """
+    Create interactive Folium map with square grids from {column: values} climate data.
+    With external_data the cells go to a .geojson file next to the HTML, loaded with fetch().
+    """
     
     if not climate_data:
         print("❌ Aucune donnée à afficher sur la carte")
         return None
     
-    # Center map on average coordinates
-    center_lat = sum(float(row['lat']) for row in climate_data) / len(climate_data)
-    center_lon = sum(float(row['lon']) for row in climate_data) / len(climate_data)
+    # Center map on average coordinates (precomputed by SQL on the database path)
+    if 'center_lat' in climate_data:
+        center_lat = float(climate_data['center_lat'][0])
+        center_lon = float(climate_data['center_lon'][0])
+    else:
+        center_lat = float(climate_data['lat'].mean())
+        center_lon = float(climate_data['lon'].mean())
     
     print(f"📍 Centre de la carte: {center_lat:.4f}, {center_lon:.4f}")
     
@@ -336,7 +596,8 @@ def create_map(climate_data, param='et0', output_file='output/climate_map.html')
         location=[center_lat, center_lon],
         zoom_start=15,
         tiles='OpenStreetMap',
-        control_scale=True
+        control_scale=True,
+        prefer_canvas=True
     )
     
     # Add plugins
@@ -358,45 +619,45 @@ def create_map(climate_data, param='et0', output_file='output/climate_map.html')
     
     
     
-    # Add grid cells
-    points_added = 0
-    values_count = 0
-    
-    for row in climate_data:
-        value = row[param]
-        if value is not None:
-            values_count += 1
-        
-        color = get_color(value, param)
-        
-        # Create square geometry
-        geom = create_square_grid(float(row['lat']), float(row['lon']))
-        
-        # Create popup and tooltip
-        popup = folium.Popup(create_popup_content(row), max_width=300)
-        tooltip = f"{row['geohash']}"
-        if value is not None:
-            tooltip += f": {value:.2f}{scheme['suffix']}"
-        
-        # Add square to map
-        folium.GeoJson(
-            geom,
-            style_function=lambda x, c=color: {
-                'fillColor': c,
-                'color': 'black',
-                'weight': 0.5,
-                'fillOpacity': 0.2
-            },
-            highlight_function=lambda x: {
-                'weight': 2,
-                'color': 'black',
-                'fillOpacity': 0.5
-            },
-            popup=popup,
-            tooltip=tooltip
-        ).add_to(m)
-        
-        points_added += 1
+    # Add grid cells: one FeatureCollection (a single Leaflet layer), colors precomputed per feature
+    points_added = len(climate_data['geohash'])
+    values = climate_data[param]
+    values_count = sum(v is not None for v in values)
+    
+    # Square geometry: from PostGIS when available (DB path, already GeoJSON text), otherwise
+    # built for all remaining cells in one vectorized pass (JSON path)
+    geoms = climate_data['geom']
+    missing = np.array([not g for g in geoms], dtype=bool)
+    rings = iter(create_square_grids(
+        climate_data['lat'][missing],
+        climate_data['lon'][missing]
+    ).tolist())
+    geoms = [g.encode() if g else orjson.dumps({"type": "Polygon", "coordinates": [next(rings)]})
+             for g in geoms]
+    # Every row is for the same date: format it once
+    date_str = format_date(climate_data['date'])
+    # uint8 palette index for every cell in one vectorized lookup (colors resolved in the browser)
+    color_indices = get_color_indices(values, param).tolist()
+    
+    # Features written straight to a bytes buffer by the generated emitter
+    buf = io.BytesIO()
+    buf.write(b'{"type":"FeatureCollection","features":[')
+    emit_features(buf, date_str, scheme['suffix'], geoms, values, color_indices,
+                  *(climate_data[name] for name in POPUP_COLUMNS))
+    buf.write(b']}')
+    
+    # Add squares to map
+    os.makedirs(os.path.dirname(output_file), exist_ok=True)
+    if external_data:
+        # Payload written to disk as is; the HTML only references it
+        geojson_file = os.path.splitext(output_file)[0] + '.geojson'
+        with open(geojson_file, 'wb') as f:
+            f.write(buf.getbuffer())
+        print(f"📦 Cellules écrites dans {geojson_file}")
+        GridLayer(None, palette=get_palette(param), name=scheme['title'],
+                  data_url=os.path.basename(geojson_file)).add_to(m)
+    else:
+        GridLayer(buf.getvalue().decode('utf-8'), palette=get_palette(param), name=scheme['title']).add_to(m)
     
     # Add layer control
     folium.LayerControl().add_to(m)
@@ -405,7 +666,6 @@ def create_map(climate_data, param='et0', output_file='output/climate_map.html')
     plugins.Draw(export=True).add_to(m)
     
     # Save map
-    os.makedirs(os.path.dirname(output_file), exist_ok=True)
     m.save(output_file)
     
     print(f"✅ {points_added} carrés affichés sur la carte")
@@ -413,6 +673,55 @@ def create_map(climate_data, param='et0', output_file='output/climate_map.html')
     print(f"🗺️ Map saved to {output_file}")
     return m
 
+# -----------------------------
+# Rendered map cache (content-addressed)
+# -----------------------------
+MAP_CACHE_DIR = '.map_cache'
+
+def map_cache_key(climate_data, param, output_file, external_data=False):
+    """
+    sha256 over everything the rendered map depends on: this script's code, date,
+    parameter, output mode, cell ids, centers, geometries and every popup value.
+    In external mode the HTML embeds the .geojson file name, so that name is hashed too
+    """
+    h = hashlib.sha256()
+    with open(os.path.abspath(__file__), 'rb') as f:
+        h.update(f.read())
+    data_name = os.path.splitext(os.path.basename(output_file))[0] if external_data else ''
+    h.update(f"{climate_data['date']}|{param}|{int(external_data)}|{data_name}".encode())
+    h.update('\0'.join(climate_data['geohash']).encode())
+    h.update('\0'.join(g or '' for g in climate_data['geom']).encode())
+    h.update(np.ascontiguousarray(climate_data['lat']).tobytes())
+    h.update(np.ascontiguousarray(climate_data['lon']).tobytes())
+    for name in POPUP_COLUMNS[1:]:
+        values = np.array([np.nan if v is None else v for v in climate_data[name]], dtype=np.float64)
+        h.update(values.tobytes())
+    return h.hexdigest()
+
+def _cached_outputs(key, output_file, external_data):
+    """(cache file, output file) pairs for one cached map (HTML, plus its .geojson if external)"""
+    pairs = [(os.path.join(MAP_CACHE_DIR, f"{key}.html"), output_file)]
+    if external_data:
+        pairs.append((os.path.join(MAP_CACHE_DIR, f"{key}.geojson"),
+                      os.path.splitext(output_file)[0] + '.geojson'))
+    return pairs
+
+def restore_cached_map(key, output_file, external_data=False):
+    """Copy a cached map to output_file; False on a cache miss"""
+    pairs = _cached_outputs(key, output_file, external_data)
+    if not all(os.path.exists(cached) for cached, _ in pairs):
+        return False
+    os.makedirs(os.path.dirname(output_file), exist_ok=True)
+    for cached, target in pairs:
+        shutil.copyfile(cached, target)
+    return True
+
+def store_cached_map(key, output_file, external_data=False):
+    """Keep a copy of a freshly rendered map in the cache"""
+    os.makedirs(MAP_CACHE_DIR, exist_ok=True)
+    for cached, target in _cached_outputs(key, output_file, external_data):
+        shutil.copyfile(target, cached)
+
 def main():
     parser = argparse.ArgumentParser(description='Generate climate map with ET0 coloring')
     parser.add_argument('--date', type=str, help='Date for data (YYYY-MM-DD)')
@@ -425,6 +734,10 @@ def main():
                        help='Use JSON file instead of database')
     parser.add_argument('--list-dates', action='store_true',
                        help='List available dates in database')
+    parser.add_argument('--external-data', action='store_true',
+                       help='Write cells to a .geojson next to the HTML (loaded with fetch, serve over HTTP)')
+    parser.add_argument('--no-cache', action='store_true',
+                       help=f'Always re-render instead of reusing an identical map from {MAP_CACHE_DIR}')
     
     args = parser.parse_args()
     
@@ -435,11 +748,11 @@ def main():
     # Parse date
     target_date = None
     if args.date:
-        target_date = datetime.strptime(args.date, '%Y-%m-%d').date()
+        target_date = date.fromisoformat(args.date)
         print(f"📅 Date demandée: {target_date}")
     
-    # Get climate data
-    climate_data = []
+    # Get climate data ({column: values})
+    climate_data = {}
     
     if args.use_json:
         # JSON mode
@@ -453,12 +766,9 @@ def main():
         # List dates mode
         conn = get_db_connection()
         if conn:
-            dates = get_available_dates(conn)
+            date_counts = get_date_counts(conn)
             print("\n📅 Dates disponibles dans climate_daily (avec données):")
-            for d in dates:
-                with conn.cursor() as cur:
-                    cur.execute("SELECT COUNT(*) FROM climate_daily WHERE date = %s AND et0 IS NOT NULL", (d,))
-                    count = cur.fetchone()[0]
+            for d, count in date_counts:
                 print(f"   - {d}: {count} enregistrements")
             conn.close()
         return
@@ -473,6 +783,7 @@ def main():
             sys.exit(1)
         
         try:
+            check_map_indexes(conn)
             climate_data = get_climate_data_from_db(conn, target_date)
         finally:
             conn.close()
@@ -493,9 +804,9 @@ def main():
         sys.exit(1)
     
     # Statistics
-    values = [row[args.param] for row in climate_data if row[args.param] is not None]
+    values = [v for v in climate_data[args.param] if v is not None]
     print(f"\n📊 Statistiques {args.param}:")
-    print(f"   Points total: {len(climate_data)}")
+    print(f"   Points total: {len(climate_data['geohash'])}")
     print(f"   Points avec valeurs: {len(values)}")
     
     if values:
@@ -505,8 +816,12 @@ def main():
     else:
         print(f"   ⚠️ Aucune valeur valide pour {args.param}")
     
-    # Create map
-    create_map(climate_data, args.param, args.output)
+    # Create map (or reuse the cached rendering of identical data)
+    cache_key = map_cache_key(climate_data, args.param, args.output, args.external_data)
+    if not args.no_cache and restore_cached_map(cache_key, args.output, args.external_data):
+        print(f"♻️ Carte identique trouvée dans le cache ({MAP_CACHE_DIR})")
+    elif create_map(climate_data, args.param, args.output, external_data=args.external_data) is not None:
+        store_cached_map(cache_key, args.output, args.external_data)
     
     print(f"\n✅ Carte générée avec succès!")
     print(f"📁 Fichier: {args.output}")
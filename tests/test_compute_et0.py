@@ -0,0 +1,76 @@
+import os
+import sys
+import tempfile
+import unittest
+import zipfile
+import xml.etree.ElementTree as ET
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+from compute_et0 import export_to_excel
+
+NS = {'m': 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'}
+
+def read_sheet(path):
+    """Return {cell ref: value} for the first sheet, read straight from the workbook XML"""
+    with zipfile.ZipFile(path) as z:
+        names = z.namelist()
+        shared = []
+        if 'xl/sharedStrings.xml' in names:
+            root = ET.fromstring(z.read('xl/sharedStrings.xml'))
+            shared = [''.join(t.text or '' for t in si.iter(f"{{{NS['m']}}}t")) for si in root.findall('m:si', NS)]
+        sheet = ET.fromstring(z.read('xl/worksheets/sheet1.xml'))
+    cells = {}
+    for c in sheet.iter(f"{{{NS['m']}}}c"):
+        kind = c.get('t')
+        if kind == 'inlineStr':
+            value = ''.join(t.text or '' for t in c.iter(f"{{{NS['m']}}}t"))
+        else:
+            v = c.find('m:v', NS)
+            if v is None:
+                continue
+            value = shared[int(v.text)] if kind == 's' else (v.text if kind == 'str' else float(v.text))
+        cells[c.get('r')] = value
+    return cells
+
+def cell_ref(row, col):
+    return f"{chr(ord('A') + col)}{row + 1}"
+
+class ExportToExcelTest(unittest.TestCase):
+    def test_every_cell_is_written(self):
+        n = 50
+        rng = np.random.default_rng(0)
+        df = pd.DataFrame({
+            'geohash': [f"sn{i:05d}" for i in range(n)],
+            'latitude': rng.uniform(36, 37, n),
+            'longitude': rng.uniform(8, 9, n),
+            'date': ['20260101'] * n,
+            'tmin': rng.uniform(0, 15, n),
+            'tmax': rng.uniform(15, 35, n),
+            'radiation': rng.uniform(5, 30, n),
+            'rh': rng.uniform(20, 90, n),
+            'wind': rng.uniform(0, 6, n),
+            'et0': rng.uniform(0, 8, n),
+        })
+        df.loc[3, 'et0'] = np.nan
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = export_to_excel(df, os.path.join(tmp, 'et0.xlsx'))
+            cells = read_sheet(path)
+
+        for col, name in enumerate(df.columns):
+            self.assertEqual(cells[cell_ref(0, col)], name)
+            for row, expected in enumerate(df[name], start=1):
+                ref = cell_ref(row, col)
+                if isinstance(expected, float) and np.isnan(expected):
+                    self.assertNotIn(ref, cells)
+                elif isinstance(expected, str):
+                    self.assertEqual(cells[ref], expected, ref)
+                else:
+                    self.assertAlmostEqual(cells[ref], expected, places=9, msg=ref)
+        self.assertEqual(len(cells), len(df.columns) * (n + 1) - 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,47 @@
+import io
+import os
+import sys
+import tempfile
+import importlib.util
+import unittest
+
+import orjson
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+
+HAS_MAP_DEPS = all(importlib.util.find_spec(m) for m in ('folium', 'branca', 'jinja2', 'psycopg2'))
+
+@unittest.skipUnless(HAS_MAP_DEPS, 'folium/branca/jinja2/psycopg2 not installed')
+class NullGeohashTest(unittest.TestCase):
+    def test_null_geohash_from_json(self):
+        import make_map
+
+        day = {'date': '20260101', 'tmin': 10.0, 'tmax': 25.0, 'rain': 0.0,
+               'rh': 60.0, 'wind': 2.0, 'et0': 4.2}
+        payload = {'results': [
+            {'geohash': None, 'latitude': 36.5, 'longitude': 8.7, 'weather_data': [day]},
+            {'geohash': 'sn12345', 'latitude': 36.6, 'longitude': 8.8, 'weather_data': [day]},
+        ]}
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'weather.json')
+            with open(path, 'wb') as f:
+                f.write(orjson.dumps(payload))
+            data = make_map.get_climate_data_from_json(path)
+
+        self.assertEqual(list(data['geohash']), ['None', 'sn12345'])
+
+        # Cache key and feature emitter both join/concatenate geohash strings
+        make_map.map_cache_key(data, 'et0', 'output/climate_map.html')
+        geoms = [b'{"type":"Point","coordinates":[0,0]}'] * 2
+        buf = io.BytesIO()
+        buf.write(b'[')
+        make_map.emit_features(buf, '2026-01-01', ' mm', geoms, data['et0'], [0, 0],
+                               *(data[name] for name in make_map.POPUP_COLUMNS))
+        buf.write(b']')
+        features = orjson.loads(buf.getvalue())
+        self.assertEqual(features[0]['properties']['geohash'], 'None')
+        self.assertEqual(features[0]['properties']['tooltip'], 'None: 4.20 mm')
+        self.assertIn('Grid Cell: None', features[0]['properties']['popup_html'])
+
+if __name__ == '__main__':
+    unittest.main()